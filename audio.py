@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+FFPROBE = os.getenv('FFPROBE_BINARY') or shutil.which('ffprobe')
+AUDIO_BITRATE = os.getenv('AUDIO_BITRATE', '128k')
+# EBU R128 style target for spoken word.
+LOUDNORM = 'loudnorm=I=-16:TP=-1.5:LRA=11'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Each worker drives one ffmpeg process, so this bounds concurrent encodes.
+AUDIO_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv('AUDIO_WORKERS', str(os.cpu_count() or 2))),
+    thread_name_prefix='audio',
+)
+
+
+def stream_to_file(response: Any, out_path: Path) -> Path:
+    """Write a ``requests`` streaming response to disk chunk by chunk."""
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    part = out_path.with_name(out_path.name + '.part')
+    try:
+        with part.open('wb') as f:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+        os.replace(part, out_path)
+    finally:
+        part.unlink(missing_ok=True)
+        response.close()
+    return out_path
+
+
+def _transcode(src: Path, out_mp3: Path) -> Path:
+    tmp = out_mp3.with_name(out_mp3.stem + '.tmp.mp3')
+    cmd = [
+        FFMPEG, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+        '-i', str(src), '-vn', '-af', LOUDNORM, '-ar', '44100',
+        '-codec:a', 'libmp3lame', '-b:a', AUDIO_BITRATE, str(tmp),
+    ]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip() or f'ffmpeg exited with {proc.returncode}')
+        os.replace(tmp, out_mp3)
+    finally:
+        tmp.unlink(missing_ok=True)
+    if src != out_mp3:
+        src.unlink(missing_ok=True)
+    return out_mp3
+
+
+def _finalize(src: Path, out_mp3: Path) -> Path:
+    if FFMPEG:
+        try:
+            return _transcode(src, out_mp3)
+        except Exception as e:
+            logger.warning('audio transcode failed for %s: %s', src, e)
+    # Without ffmpeg keep the source, but never under a misleading extension.
+    final = out_mp3 if src.suffix.lower() == '.mp3' else out_mp3.with_suffix(src.suffix)
+    if src != final:
+        os.replace(src, final)
+    return final
+
+
+def submit_finalize(src: Path, out_mp3: Path) -> Future[Path]:
+    """Queue loudness normalisation and MP3 encoding of ``src`` on the audio pool."""
+    return AUDIO_POOL.submit(_finalize, src, out_mp3)
+
+
+def finalize_audio(src: Path, out_mp3: Path) -> Path:
+    """Normalise and transcode ``src`` to ``out_mp3``, returning the final file.
+
+    If ffmpeg is not available the source is kept with its real extension.
+    """
+    return submit_finalize(src, out_mp3).result()
+
+
+def find_voice(audio_dir: Path) -> Path | None:
+    """Return the narration file in ``audio_dir`` whatever its container."""
+    for name in ('voice.mp3', 'voice.wav', 'voice.aiff'):
+        p = audio_dir / name
+        if p.exists():
+            return p
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Probing
+
+_MPEG1_L3_KBPS = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_MPEG2_L3_KBPS = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+
+def _mp3_info(path: Path) -> dict | None:
+    """Estimate duration/bitrate from the first MP3 frame header (CBR)."""
+    with path.open('rb') as f:
+        tag = f.read(10)
+        offset = 0
+        if tag[:3] == b'ID3' and len(tag) == 10:
+            offset = 10 + ((tag[6] & 0x7F) << 21 | (tag[7] & 0x7F) << 14
+                           | (tag[8] & 0x7F) << 7 | (tag[9] & 0x7F))
+        f.seek(offset)
+        head = f.read(64 * 1024)
+    for i in range(len(head) - 3):
+        if head[i] != 0xFF or head[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (head[i + 1] >> 3) & 0x03
+        layer = (head[i + 1] >> 1) & 0x03
+        index = head[i + 2] >> 4
+        if layer != 0x01 or version == 0x01 or index in (0, 15):
+            continue
+        kbps = (_MPEG1_L3_KBPS if version == 0x03 else _MPEG2_L3_KBPS)[index]
+        audio_bytes = path.stat().st_size - offset - i
+        return {'duration_s': round(audio_bytes * 8 / (kbps * 1000), 2), 'bitrate_kbps': kbps}
+    return None
+
+
+def _wav_info(path: Path) -> dict | None:
+    try:
+        with wave.open(str(path), 'rb') as w:
+            rate = w.getframerate()
+            kbps = rate * w.getsampwidth() * 8 * w.getnchannels() // 1000
+            return {'duration_s': round(w.getnframes() / rate, 2), 'bitrate_kbps': kbps}
+    except (wave.Error, EOFError):
+        return None
+
+
+def probe_audio(path: Path) -> dict[str, Any]:
+    """Return ``duration_s``, ``bitrate_kbps``, ``format`` and ``bytes`` of an audio file."""
+    info: dict[str, Any] = {'format': path.suffix.lstrip('.').lower(), 'bytes': path.stat().st_size}
+    if FFPROBE:
+        try:
+            out = subprocess.run(
+                [FFPROBE, '-v', 'error', '-show_entries', 'format=duration,bit_rate,format_name',
+                 '-of', 'json', str(path)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            fmt = json.loads(out).get('format', {})
+            info['duration_s'] = round(float(fmt['duration']), 2)
+            info['bitrate_kbps'] = int(fmt['bit_rate']) // 1000
+            return info
+        except Exception as e:
+            logger.warning('ffprobe failed for %s: %s', path, e)
+    if info['format'] == 'wav':
+        info.update(_wav_info(path) or {})
+    elif info['format'] == 'mp3':
+        info.update(_mp3_info(path) or {})
+    return info
@@ -0,0 +1,109 @@
+"""Compare the memory of order dicts with compact ``OrderRecord`` rows.
+
+Builds the same synthetic orders twice, as the plain dicts the importer used
+to produce and as ``orders.OrderRecord``, and reports traced heap size,
+build time and the time of a status/tag scan over the whole working set.
+
+    python bench_order_records.py              # 100k orders
+    python bench_order_records.py --orders 20000
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from orders import OrderRecord, TextStore
+
+COVERS = ['Premium Hardcover', 'Standard Hardcover', 'Softcover']
+NARRATIONS = ['None', 'Narrated by your loved one', 'Narrated by a professional']
+STATUSES = ['Pending to NotebookLM', 'Pending to Storybook', 'Pending storybook upload',
+            'Pending yo revise PDF', 'DONE']
+TAGS = ['qr', 'voice', 'qr_audio', 'gift', 'express', 'photos']
+FIRST = 'ana ben carla diego elena fran gloria hugo ines javier lucia mateo nora pablo rosa sergio'.split()
+LAST = 'garcia lopez martin sanchez perez gomez ruiz diaz moreno alvarez romero navarro'.split()
+DOMAINS = ['gmail.com', 'hotmail.com', 'yahoo.es', 'outlook.com']
+WORDS = ('familia abuela domingo pan luna mar viento receta jardín canción '
+         'noche bosque perro viaje estrella casa cumpleaños').split()
+
+
+def make_order(rng: random.Random) -> dict:
+    """One order shaped like ``main._order_from_record`` output after import."""
+    cover = rng.choice(COVERS)
+    story = ' '.join(rng.choices(WORDS, k=rng.randint(60, 140)))
+    names = [f'Personaje{rng.randint(1, 999)}' for _ in range(rng.randint(0, 3))]
+    return {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        # spreadsheet cells become fresh str objects, as with pandas
+        'created': ''.join(['2024-0', str(rng.randint(1, 9)), '-1', str(rng.randint(0, 9))]),
+        'order': str(rng.randint(1000, 999999)),
+        'client': f'{rng.choice(FIRST).title()} {rng.choice(LAST).title()}',
+        'email': f'{rng.choice(FIRST)}.{rng.choice(LAST)}{rng.randint(1, 99)}@{rng.choice(DOMAINS)}',
+        'cover': ''.join(cover),
+        'tags': [''.join(t) for t in rng.sample(TAGS, rng.randint(0, 3))],
+        'personalized_characters': len(names),
+        'narration': ''.join(rng.choice(NARRATIONS)),
+        'revisions': rng.randint(0, 2),
+        'voice_name': rng.choice(['', 'Luz', 'Carlos']),
+        'voice_seed': '',
+        'voice_text': ' '.join(rng.choices(WORDS, k=rng.randint(0, 30))),
+        'voice_sample': '',
+        'story': story,
+        'character_names': names,
+        'photos': [f'https://cdn.example.com/{rng.getrandbits(40):x}.jpg' for _ in names],
+        'pages': 24 if cover == 'Premium Hardcover' else 32,
+        'notebook_text': 'Genera una historia a partir de la siguiente información:\n' + story,
+        'status': ''.join(rng.choice(STATUSES)),
+    }
+
+
+def measure(label: str, build, match) -> tuple[list, int]:
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    rows = build()
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    hits = sum(1 for r in rows if match(r))
+    scan = time.perf_counter() - t0
+    print(f'{label:<14}{size / 2**20:>10.1f}{size / len(rows):>10.0f}{elapsed:>10.2f}{scan * 1000:>10.1f}  ({hits} hits)')
+    return rows, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    tmp = Path(tempfile.mkdtemp(prefix='ecs_orderbench_'))
+    OrderRecord.texts = TextStore(tmp / 'texts.db')
+
+    print(f"{'layout':<14}{'heap MB':>10}{'B/order':>10}{'build s':>10}{'scan ms':>10}")
+    rng = random.Random(args.seed)
+    dicts, dict_size = measure('dict', lambda: [make_order(rng) for _ in range(args.orders)],
+                               lambda r: r['status'] == 'DONE' and 'voice' in r['tags'])
+    del dicts
+    rng = random.Random(args.seed)
+    records, rec_size = measure('OrderRecord', lambda: [OrderRecord(make_order(rng)) for _ in range(args.orders)],
+                                lambda r: r.status == 'DONE' and r.has_tag('voice'))
+    disk = (tmp / 'texts.db').stat().st_size
+    print(f'heap ratio {rec_size / dict_size:.1%}; long texts on disk: {disk / 2**20:.1f} MB')
+
+    t0 = time.perf_counter()
+    for r in random.Random(2).sample(records, 1000):
+        r['story']
+    print(f'lazy story load: {(time.perf_counter() - t0):.3f} ms/order')
+    OrderRecord.texts.close()
+    tmp.rmdir()
+
+
+if __name__ == '__main__':
+    main()
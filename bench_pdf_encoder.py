@@ -0,0 +1,74 @@
+"""Compare the print PDF encoder with Pillow's PDF writer.
+
+Renders storybook pages exactly like ``postprocess_storybooks`` and writes
+them once with the old writer (every page as RGB) and once with
+``pdf_encoder.encode_pdf``, reporting file size and encode time.
+
+    python bench_pdf_encoder.py                     # synthetic 24-page storybook
+    python bench_pdf_encoder.py libro1.pdf libro2.pdf
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+from reportlab.lib.pagesizes import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from pdf_encoder import encode_pdf
+from postprocess import render_storybook_pages
+
+LOGO = Path(__file__).parent / 'assets' / 'logo nuevo png.png'
+
+
+def make_storybook(path: Path, pages: int) -> Path:
+    """Write a storybook-like PDF: colour cover, illustrated and text pages."""
+    size = (6 * inch, 9 * inch)
+    c = canvas.Canvas(str(path), pagesize=size)
+    art = Image.radial_gradient('L').resize((400, 400)).convert('RGB')
+    ImageDraw.Draw(art).ellipse((80, 80, 320, 320), fill=(240, 160, 60))
+    for i in range(pages):
+        if i % 2 == 0:
+            c.drawImage(ImageReader(art), 36, 200, width=360, height=360)
+        c.setFont('Helvetica', 14)
+        for line in range(8):
+            c.drawString(40, 160 - line * 16, f'Página {i + 1}: había una vez una familia que...')
+        c.showPage()
+    c.save()
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pdfs', nargs='*', type=Path)
+    parser.add_argument('--pages', type=int, default=24)
+    args = parser.parse_args()
+    tmp = Path(tempfile.mkdtemp(prefix='ecs_pdfbench_'))
+    pdfs = args.pdfs or [make_storybook(tmp / 'storybook.pdf', args.pages)]
+    images = render_storybook_pages(pdfs, LOGO)
+
+    t0 = time.perf_counter()
+    rgb = [im.convert('RGB') for im in images]
+    rgb[0].save(tmp / 'pil.pdf', save_all=True, append_images=rgb[1:], format='PDF')
+    pil_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    kinds = encode_pdf(images, tmp / 'encoded.pdf')
+    enc_time = time.perf_counter() - t0
+
+    pil_size = (tmp / 'pil.pdf').stat().st_size
+    enc_size = (tmp / 'encoded.pdf').stat().st_size
+    print(f'{len(images)} pages, encodings: {dict(Counter(kinds))}')
+    print(f"{'writer':<12}{'size KB':>12}{'time s':>10}")
+    print(f"{'PIL':<12}{pil_size / 1024:>12.1f}{pil_time:>10.3f}")
+    print(f"{'encoder':<12}{enc_size / 1024:>12.1f}{enc_time:>10.3f}")
+    print(f'size ratio {enc_size / pil_size:.2%}, output in {tmp}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Measure order search latency over a large synthetic working set.
+
+Indexes synthetic orders (see ``bench_order_records.make_order``) in
+``search.OrderIndex`` and reports index build time, per-query latency
+percentiles for a typical query mix and the cost of a status update.
+
+    python bench_search.py                 # 100k orders
+    python bench_search.py --orders 20000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+
+from bench_order_records import make_order
+from search import OrderIndex
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    rows = [make_order(rng) for _ in range(args.orders)]
+
+    index = OrderIndex()
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), 1000):  # imports arrive in batches
+        index.add(rows[i:i + 1000])
+    print(f'indexed {len(index)} orders in {time.perf_counter() - t0:.2f} s')
+
+    def sample_query() -> str:
+        r = rng.choice(rows)
+        return rng.choice([
+            r['order'], r['client'], r['email'].split('@')[0], r['email'],
+            r['story'].split()[rng.randrange(10)], ' '.join(r['story'].split()[:2]),
+            f"status:{r['status'].split()[0]}", f"tags:{rng.choice(['voice', 'qr', 'gift'])}",
+            r['client'][:4], r['client'] + ' ' + r['status'].split()[0],
+        ])
+
+    timings: dict[str, list[float]] = {'search': [], 'update_status': []}
+    for _ in range(args.queries):
+        q = sample_query()
+        t0 = time.perf_counter()
+        index.search(q)
+        timings['search'].append((time.perf_counter() - t0) * 1000)
+        r = rng.choice(rows)
+        r['status'] = 'DONE'
+        t0 = time.perf_counter()
+        index.update_status(r)
+        timings['update_status'].append((time.perf_counter() - t0) * 1000)
+
+    print(f"{'operation':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in timings.items():
+        q = statistics.quantiles(values, n=100)
+        print(f'{name:<16}{q[49]:>10.2f}{q[94]:>10.2f}{q[98]:>10.2f}{max(values):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark the Shopify tag/variant parser on a large export.
+
+Generates tag strings in the format of ``data/orders_index.json`` and parses
+them once row by row (split and regex per order, as a per-row importer
+would) and once with ``variants.parse_variants`` over the whole column.
+
+    python bench_variants.py                # 100k rows
+    python bench_variants.py --rows 20000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import string
+import time
+
+from variants import OPTION_RE, parse_variants, split_options
+
+SIZES = ['Pequeño (6 Centímetros)', 'Medio (10 Centímetros)', 'Grande (19 Centímetros)']
+THEMES = ['Sin Temática', 'Corazones + 3.99€', 'Flores + 3.99€', 'Estrellas + 2,50€']
+TONES = ['Rosado', 'Azulado', 'Neutro', 'Variado', 'Rojizo']
+
+
+def make_tags(rng: random.Random) -> str:
+    parts = [f'Escoja su letra: {c}' for c in sorted(rng.sample(string.ascii_uppercase, rng.choice([1, 1, 2])))]
+    parts += [f'Tamaño: {rng.choice(SIZES)}', f'Temática: {rng.choice(THEMES)}', 'tepo']
+    parts += [f'Tonalidad: {t}' for t in rng.sample(TONES, rng.choice([1, 1, 2]))]
+    if rng.random() < 0.8:
+        parts.append('¿Como la prefieres?: Lista para decorar')
+    if rng.random() < 0.1:
+        parts.append(rng.choice(['voice', 'qr', 'qr_audio']))
+    return ', '.join(parts)
+
+
+def parse_row(text: str) -> tuple[list[str], dict]:
+    """Row-at-a-time baseline with the same patterns."""
+    tags: list[str] = []
+    options: dict[str, list[str]] = {}
+    for part in split_options(text or ''):
+        m = OPTION_RE.match(part.strip())
+        if not m or not m['value']:
+            continue
+        if m['label']:
+            options.setdefault(m['label'], []).append(m['value'])
+        else:
+            tags.append(m['value'])
+    return tags, options
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    column = [make_tags(rng) for _ in range(args.rows)]
+    print(f'{args.rows} rows, {len(set(column))} distinct tag strings')
+
+    t0 = time.perf_counter()
+    for text in column:
+        parse_row(text)
+    per_row = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    parsed = parse_variants(column)
+    column_wise = time.perf_counter() - t0
+
+    print(f"{'parser':<16}{'total s':>10}{'us/row':>10}")
+    print(f"{'row by row':<16}{per_row:>10.3f}{per_row / args.rows * 1e6:>10.2f}")
+    print(f"{'parse_variants':<16}{column_wise:>10.3f}{column_wise / args.rows * 1e6:>10.2f}")
+    tags, spec = parsed[0]
+    print(f'example: {column[0]!r}\n  tags={tags} variant={spec}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# Already-compressed formats are stored in ZIPs as-is instead of deflated again.
+STORED_SUFFIXES = {'.pdf', '.jpg', '.jpeg', '.png', '.mp3', '.m4a', '.zip'}
+# Blobs younger than this are never collected, so a blob that was just
+# stored but not yet linked into a work dir survives a concurrent sweep.
+GC_GRACE_SECONDS = 600
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _clone(src: Path, dst: Path) -> None:
+    """Hardlink ``src`` to ``dst``; reflink or copy across filesystems."""
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        import fcntl
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), 0x40049409, s.fileno())  # FICLONE
+        return
+    except (ImportError, OSError):
+        dst.unlink(missing_ok=True)
+    shutil.copyfile(src, dst)
+
+
+class BlobStore:
+    """Content-addressed store for order artifacts, shared through hardlinks.
+
+    Files live once as ``<root>/<sha[:2]>/<sha>`` and appear in work dirs as
+    hardlinks, so the link count doubles as a reference count: a blob whose
+    only link is the store's own is unused and removed by :meth:`gc`. ZIPs
+    are cached under ``<root>/zips`` by a hash of the bundle manifest and
+    rebuilt only when the bundle changes.
+
+    Stored files must be treated as read-only: editing one in place changes
+    every order that links it.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.zips = root / 'zips'
+        self.zips.mkdir(parents=True, exist_ok=True)
+
+    def path(self, sha: str) -> Path:
+        return self.root / sha[:2] / sha
+
+    def put(self, src: Path) -> str:
+        """Store ``src`` and return its hash; ``src`` itself is left in place."""
+        sha = file_sha256(src)
+        blob = self.path(sha)
+        if not blob.exists():
+            blob.parent.mkdir(exist_ok=True)
+            tmp = blob.with_name(f'{sha}.{os.getpid()}.{time.monotonic_ns()}.tmp')
+            _clone(src, tmp)
+            os.replace(tmp, blob)
+        return sha
+
+    def link(self, sha: str, dst: Path) -> Path:
+        """Make ``dst`` a link to blob ``sha``, replacing whatever was there."""
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f'.{dst.name}.{time.monotonic_ns()}.tmp')
+        _clone(self.path(sha), tmp)
+        os.replace(tmp, dst)
+        return dst
+
+    def place(self, src: Path, dst: Path) -> str:
+        """Store ``src`` and link it at ``dst`` (the replacement for copying)."""
+        sha = self.put(src)
+        if not dst.exists() or not os.path.samefile(self.path(sha), dst):
+            self.link(sha, dst)
+        return sha
+
+    def adopt(self, path: Path) -> str:
+        """Move a freshly written file into the store, leaving a link behind.
+
+        A file whose content is already stored becomes a link to that copy.
+        """
+        return self.place(path, path)
+
+    # -- ZIP cache ---------------------------------------------------------
+
+    def bundle_key(self, manifest: dict[str, Any]) -> str:
+        """Hash of a manifest without its volatile fields."""
+        stable = {k: v for k, v in manifest.items() if k != 'generated_at'}
+        data = json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def zip_dir(self, src: Path, key: str, dst: Path) -> bool:
+        """Link the cached ZIP of ``src`` for bundle ``key`` at ``dst``.
+
+        The archive is only built when no ZIP for ``key`` exists yet.
+        Returns ``True`` when it had to be built.
+        """
+        cached = self.zips / f'{key}.zip'
+        built = False
+        if not cached.exists():
+            fd, name = tempfile.mkstemp(dir=self.zips, suffix='.part')
+            os.close(fd)
+            try:
+                write_zip(src, Path(name))
+                os.replace(name, cached)
+            finally:
+                Path(name).unlink(missing_ok=True)
+            built = True
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f'.{dst.name}.{time.monotonic_ns()}.tmp')
+        _clone(cached, tmp)
+        os.replace(tmp, dst)
+        return built
+
+    # -- accounting --------------------------------------------------------
+
+    def _entries(self) -> list[os.DirEntry]:
+        entries: list[os.DirEntry] = []
+        for sub in os.scandir(self.root):
+            if sub.is_dir(follow_symlinks=False):
+                entries.extend(e for e in os.scandir(sub.path) if e.is_file(follow_symlinks=False))
+        return entries
+
+    def usage(self) -> dict[str, int]:
+        """Blob count, bytes on disk and the store's share of them.
+
+        Like ``storage._tree_size``, a file with n links is charged 1/n to
+        each place that links it, so shares add up to real disk usage.
+        """
+        blobs = total = share = 0
+        for e in self._entries():
+            st = e.stat(follow_symlinks=False)
+            blobs += 1
+            total += st.st_size
+            share += st.st_size // st.st_nlink
+        return {'blobs': blobs, 'bytes': total, 'share_bytes': share}
+
+    def gc(self, grace: float = GC_GRACE_SECONDS) -> int:
+        """Remove blobs and cached ZIPs no work dir links to; returns bytes freed."""
+        now = time.time()
+        freed = 0
+        for e in self._entries():
+            st = e.stat(follow_symlinks=False)
+            if st.st_nlink > 1 or now - st.st_mtime < grace:
+                continue
+            try:
+                os.unlink(e.path)
+                freed += st.st_size
+            except OSError:
+                logger.warning('could not remove blob %s', e.path)
+        return freed
+
+
+def write_zip(src: Path, zip_path: Path) -> None:
+    """ZIP ``src`` deterministically, storing already-compressed files as-is."""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for p in sorted(src.rglob('*')):
+            if p.is_file() and not p.name.startswith('.'):
+                compress = zipfile.ZIP_STORED if p.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+                z.write(p, p.relative_to(src), compress_type=compress)
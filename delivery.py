@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import hashlib
+import html
+import json
+import mimetypes
+import os
+import stat
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any
+
+import anyio
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+# Artifacts may be regenerated under the same path, so clients revalidate
+# with the ETag once max-age expires instead of treating them as immutable.
+CACHE_CONTROL = 'public, max-age=3600'
+
+mimetypes.add_type('audio/mpeg', '.mp3')
+mimetypes.add_type('audio/wav', '.wav')
+
+
+# ---------------------------------------------------------------------------
+# Order -> artifact index
+
+
+class ArtifactIndex:
+    """In-memory map of order number to its latest generated bundle."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._orders: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, order: str, work_dir: Path, zip_path: Path | None, manifest: dict) -> None:
+        entry = {
+            'order': order,
+            'dir': work_dir.name,
+            'zip': zip_path.name if zip_path else None,
+            'book': (manifest.get('docs') or {}).get('book'),
+            'audio': manifest.get('audio'),
+            'generated_at': manifest.get('generated_at') or '',
+        }
+        with self._lock:
+            current = self._orders.get(order)
+            if current is None or entry['generated_at'] >= current['generated_at']:
+                self._orders[order] = entry
+
+    def remove_dir(self, work_dir: Path) -> None:
+        with self._lock:
+            for order, entry in list(self._orders.items()):
+                if entry['dir'] == work_dir.name:
+                    del self._orders[order]
+
+    def get(self, order: str) -> dict[str, Any] | None:
+        return self._orders.get(order)
+
+    def load_dir(self, work_dir: Path) -> bool:
+        """Index a work dir from its ``manifest.json`` (e.g. written by another node)."""
+        try:
+            manifest = json.loads((work_dir / 'manifest.json').read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return False
+        order = str(manifest.get('order') or '')
+        if not order:
+            return False
+        zip_path = self.root / f'order_{order}.zip'
+        self.add(order, work_dir, zip_path if zip_path.exists() else None, manifest)
+        return True
+
+    def scan(self) -> int:
+        """Rebuild the index from the manifests already on disk."""
+        return sum(self.load_dir(p.parent) for p in self.root.glob('order_*/manifest.json'))
+
+
+# ---------------------------------------------------------------------------
+# File responses
+
+
+def make_etag(st: os.stat_result) -> str:
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single ``bytes=`` range into inclusive offsets.
+
+    Returns ``None`` when the header should be ignored (malformed or several
+    ranges) and raises ``ValueError`` when the range is not satisfiable.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = (p.strip() for p in spec.partition('-'))
+    if not sep or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+        return None
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('range not satisfiable')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and start > end:
+        return None
+    if start >= size:
+        raise ValueError('range not satisfiable')
+    return start, min(end, size - 1)
+
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    inm = request.headers.get('if-none-match')
+    if inm is not None:
+        tags = [t.strip().removeprefix('W/') for t in inm.split(',')]
+        return '*' in tags or etag in tags
+    ims = request.headers.get('if-modified-since')
+    if ims:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class FileRangeResponse(Response):
+    """Send ``[start, end]`` of a file, zero-copy when the server supports it.
+
+    Servers advertising the ``http.response.zerocopysend`` ASGI extension get
+    the open file descriptor (``sendfile``); ``http.response.pathsend`` is used
+    for whole files; otherwise the file is streamed in ``CHUNK_SIZE`` reads.
+    """
+
+    def __init__(self, path: Path, start: int, end: int, status_code: int,
+                 headers: dict[str, str], media_type: str, head: bool = False) -> None:
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.head = head
+        self.headers['content-length'] = str(max(end - start + 1, 0))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        count = self.end - self.start + 1
+        if self.head or count <= 0:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        extensions = scope.get('extensions') or {}
+        if 'http.response.zerocopysend' in extensions:
+            with open(self.path, 'rb') as f:
+                await send({'type': 'http.response.zerocopysend', 'file': f.fileno(),
+                            'offset': self.start, 'count': count})
+            return
+        if 'http.response.pathsend' in extensions and self.start == 0 and self.status_code == 200:
+            await send({'type': 'http.response.pathsend', 'path': str(self.path)})
+            return
+        async with await anyio.open_file(self.path, 'rb') as f:
+            await f.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining > 0:
+                await send({'type': 'http.response.body', 'body': b''})
+
+
+def serve_file(request: Request, path: Path, cache_control: str = CACHE_CONTROL) -> Response:
+    """Answer a GET/HEAD for ``path`` honouring conditional and Range headers."""
+    try:
+        st = path.stat()
+    except OSError:
+        return PlainTextResponse('Not found', status_code=404)
+    if not stat.S_ISREG(st.st_mode):
+        return PlainTextResponse('Not found', status_code=404)
+    etag = make_etag(st)
+    headers = {
+        'etag': etag,
+        'last-modified': formatdate(st.st_mtime, usegmt=True),
+        'cache-control': cache_control,
+        'accept-ranges': 'bytes',
+    }
+    if _not_modified(request, etag, st):
+        return Response(status_code=304, headers=headers)
+    media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+    head = request.method == 'HEAD'
+    size = st.st_size
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers['content-range'] = f'bytes */{size}'
+            return Response(status_code=416, headers=headers)
+        if byte_range:
+            start, end = byte_range
+            headers['content-range'] = f'bytes {start}-{end}/{size}'
+            return FileRangeResponse(path, start, end, 206, headers, media_type, head)
+    return FileRangeResponse(path, 0, size - 1, 200, headers, media_type, head)
+
+
+# ---------------------------------------------------------------------------
+# Routes
+
+
+_LANDING = """<!doctype html>
+<html lang="es"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<title>Endless Chapters · Pedido {order}</title>
+<style>body{{font-family:system-ui,sans-serif;max-width:32rem;margin:2rem auto;padding:0 1rem}}
+audio{{width:100%}}a{{display:block;margin:1rem 0}}</style></head>
+<body><h1>Tu historia</h1><p>Pedido {order}</p>{body}</body></html>"""
+
+
+def create_router(index: ArtifactIndex, prefix: str = '/downloads') -> APIRouter:
+    """Public delivery routes: artifact files under ``prefix`` and ``/o/{order}``."""
+    router = APIRouter()
+    root = index.root.resolve()
+
+    @router.api_route(prefix + '/{path:path}', methods=['GET', 'HEAD'], include_in_schema=False)
+    def download(path: str, request: Request) -> Response:
+        target = (root / path).resolve()
+        if not target.is_relative_to(root):
+            return PlainTextResponse('Not found', status_code=404)
+        return serve_file(request, target)
+
+    @router.api_route('/o/{order}', methods=['GET', 'HEAD'], include_in_schema=False)
+    def landing(order: str, request: Request) -> Response:
+        entry = index.get(order)
+        if entry is None:
+            return HTMLResponse(_LANDING.format(order=html.escape(order), body='<p>Tu pedido aún se está preparando.</p>'),
+                                status_code=404, headers={'cache-control': 'no-cache'})
+        base = f"{prefix}/{entry['dir']}"
+        parts: list[str] = []
+        if entry.get('audio'):
+            parts.append(f'<audio controls preload="metadata" src="{html.escape(base)}/{html.escape(entry["audio"])}"></audio>')
+        if entry.get('book') and (root / entry['dir'] / entry['book']).exists():
+            parts.append(f'<a href="{html.escape(base)}/{html.escape(entry["book"])}">Ver libro (PDF)</a>')
+        elif entry.get('zip') and (root / entry['zip']).exists():
+            # Work dirs of finished orders are purged down to audio + ZIP.
+            parts.append(f'<a href="{html.escape(prefix)}/{html.escape(entry["zip"])}">Descargar libro (ZIP)</a>')
+        body = _LANDING.format(order=html.escape(order), body=''.join(parts))
+        etag = '"' + hashlib.sha1(body.encode('utf-8')).hexdigest()[:16] + '"'
+        headers = {'etag': etag, 'cache-control': 'no-cache'}
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+    return router
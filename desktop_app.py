@@ -1,32 +1,46 @@
 from __future__ import annotations
 
+import os
+import threading
 import webbrowser
-from tkinter import Tk, Frame, Button, messagebox, filedialog
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import Tk, Frame, Button, Entry, Label, StringVar, Widget, messagebox, filedialog
 from tkinter import ttk
 
 import pyperclip
 
 from pathlib import Path
-import tempfile
 
 from main import (
     prepare_notebook_text,
     books_for_cover,
-    synth_voice,
-    generate_order_bundle,
-    DOWNLOAD_DIR,
-    ASSETS_DIR,
+    preflight_storybook,
+    process_storybook,
+    JobCancelled,
+    STORAGE,
+    STORAGE_SWEEP_SECONDS,
+    SEARCH,
+    SEARCH_LIMIT,
 )
-from postprocess import postprocess_storybooks
 from sample_orders import get_sample_orders
+from orders import OrderRecord
+from preflight import format_errors
 
-ORDERS: list[dict] = []
-ROW_BUTTONS: dict[str, list[Button]] = {}
+ORDERS: list[OrderRecord] = []
+VISIBLE: list[OrderRecord] = []
+ROW_BUTTONS: dict[str, list[Widget]] = {}
+PROGRESS_BARS: dict[str, ttk.Progressbar] = {}
+# Storybook jobs run off the Tk main thread; several orders can run at once.
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('DESKTOP_WORKERS', '2')),
+                              thread_name_prefix='storybook')
+JOBS: dict[str, dict] = {}
+POLL_MS = 200
 
 def load_samples() -> None:
     """Load three sample orders and populate the table."""
+    SEARCH.remove(r['id'] for r in ORDERS)
     ORDERS.clear()
-    samples = get_sample_orders()
+    samples = [OrderRecord(s) for s in get_sample_orders()]
     for s in samples:
         try:
             prepare_notebook_text(s)
@@ -34,15 +48,33 @@ def load_samples() -> None:
         except Exception as e:
             messagebox.showerror('Error', f'No se pudieron preparar los datos: {e}')
             break
+    SEARCH.add(ORDERS)
     refresh_table()
 
+def _status_text(row: dict) -> str:
+    job = JOBS.get(row['id'])
+    if job is None:
+        return row.get('status', '')
+    return f"{job['message']} ({int(job['progress'] * 100)}%)"
+
+
+def _visible_orders() -> list[OrderRecord]:
+    text = search_var.get().strip()
+    if not text:
+        return list(ORDERS)
+    by_id = {r['id']: r for r in ORDERS}
+    return [by_id[rid] for rid in SEARCH.search(text, SEARCH_LIMIT) if rid in by_id]
+
+
 def refresh_table() -> None:
+    VISIBLE[:] = _visible_orders()
     tree.delete(*tree.get_children())
     for btns in ROW_BUTTONS.values():
         for btn in btns:
             btn.destroy()
     ROW_BUTTONS.clear()
-    for row in ORDERS:
+    PROGRESS_BARS.clear()
+    for row in VISIBLE:
         tree.insert(
             '',
             'end',
@@ -55,7 +87,7 @@ def refresh_table() -> None:
                 row.get('personalized_characters', 0),
                 row.get('narration', ''),
                 row.get('revisions', 0),
-                row.get('status', ''),
+                _status_text(row),
                 '',
             ),
         )
@@ -63,7 +95,7 @@ def refresh_table() -> None:
 
 
 def _place_buttons() -> None:
-    for row in ORDERS:
+    for row in VISIBLE:
         bbox = tree.bbox(row['id'], column='action')
         if not bbox:
             root.after(10, _place_buttons)
@@ -95,6 +127,17 @@ def _place_buttons() -> None:
             )
             btn.place(x=x, y=y, width=w, height=h)
             buttons.append(btn)
+        elif row['id'] in JOBS:
+            bar = ttk.Progressbar(tree, maximum=100, value=JOBS[row['id']]['progress'] * 100)
+            bar.place(x=x, y=y, width=w - 40, height=h)
+            btn = Button(
+                tree,
+                text='✕',
+                command=lambda rid=row['id']: cancel_job(rid),
+            )
+            btn.place(x=x + w - 40, y=y, width=40, height=h)
+            PROGRESS_BARS[row['id']] = bar
+            buttons.extend([bar, btn])
         ROW_BUTTONS[row['id']] = buttons
 
 
@@ -119,31 +162,90 @@ def open_storybook(row_id: str) -> None:
 
 def upload_storybook(row_id: str) -> None:
     row = next(r for r in ORDERS if r['id'] == row_id)
+    if row_id in JOBS:
+        return
     expected = books_for_cover(row.get('cover', ''))
     files = filedialog.askopenfilenames(filetypes=[('PDF', '*.pdf')])
     if not files:
         return
-    if len(files) != expected:
-        messagebox.showerror('Error', f'Se esperaban {expected} archivos')
+    errors = preflight_storybook(row, [Path(f) for f in files], expected_files=expected)
+    if errors:
+        messagebox.showerror('Storybook no válido', format_errors(errors))
         return
-    try:
-        temp_dir = Path(tempfile.mkdtemp())
-        paths = [Path(f) for f in files]
-        final_pdf = temp_dir / 'storybook.pdf'
-        postprocess_storybooks(paths, final_pdf, ASSETS_DIR / 'logo nuevo png.png')
-        audio_dir = DOWNLOAD_DIR / f"order_{row['order']}_{row['id']}" / 'audio'
-        synth_voice(row, audio_dir)
-        generate_order_bundle(row, DOWNLOAD_DIR, final_pdf)
-        row['status'] = 'Pending yo revise PDF'
-        messagebox.showinfo('Listo', 'Storybook procesado')
-    except Exception as e:
-        messagebox.showerror('Error', f'No se pudo procesar: {e}')
+    job = {'progress': 0.0, 'message': 'En cola', 'cancel': threading.Event()}
+
+    def report(fraction: float, message: str) -> None:
+        # called from the worker thread; _poll_jobs picks it up on the Tk thread
+        job['progress'] = fraction
+        job['message'] = message
+
+    job['future'] = EXECUTOR.submit(process_storybook, row, [Path(f) for f in files], report, job['cancel'])
+    JOBS[row_id] = job
+    row['status'] = 'Processing storybook'
     refresh_table()
 
 
+def cancel_job(row_id: str) -> None:
+    job = JOBS.get(row_id)
+    if job is None:
+        return
+    job['cancel'].set()
+    job['future'].cancel()
+    job['message'] = 'Cancelando'
+
+
+def _poll_jobs() -> None:
+    """Move worker progress into the table and settle finished jobs."""
+    finished: list[str] = []
+    errors: list[str] = []
+    for row_id, job in list(JOBS.items()):
+        if tree.exists(row_id):
+            tree.set(row_id, 'status', f"{job['message']} ({int(job['progress'] * 100)}%)")
+        if row_id in PROGRESS_BARS:
+            PROGRESS_BARS[row_id]['value'] = job['progress'] * 100
+        future = job['future']
+        if not future.done():
+            continue
+        del JOBS[row_id]
+        finished.append(row_id)
+        row = next((r for r in ORDERS if r['id'] == row_id), None)
+        if row is None:
+            continue
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or isinstance(error, JobCancelled):
+            row['status'] = 'Pending storybook upload'
+        elif error is not None:
+            row['status'] = 'Pending storybook upload'
+            errors.append(f"Pedido {row['order']}: {error}")
+        else:
+            row['status'] = 'Pending yo revise PDF'
+    if finished:
+        refresh_table()
+    root.after(POLL_MS, _poll_jobs)
+    for message in errors:
+        messagebox.showerror('Error', f'No se pudo procesar: {message}')
+
+
+def on_close() -> None:
+    for job in JOBS.values():
+        job['cancel'].set()
+    EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    root.destroy()
+
+
+STORAGE.statuses = lambda: {r['id']: r.get('status', '') for r in ORDERS}
+STORAGE.start(STORAGE_SWEEP_SECONDS)
+
 root = Tk()
 root.title('Endless Chapters')
 
+search_bar = Frame(root)
+search_bar.pack(fill='x', padx=5, pady=5)
+Label(search_bar, text='Buscar:').pack(side='left')
+search_var = StringVar(root)
+Entry(search_bar, textvariable=search_var).pack(side='left', fill='x', expand=True)
+search_var.trace_add('write', lambda *_: refresh_table())
+
 columns = (
     'order',
     'client',
@@ -178,5 +280,7 @@ btns = Frame(root)
 btns.pack(pady=5)
 Button(btns, text='Cargar pedidos de prueba', command=load_samples).pack(side='left', padx=5)
 
+root.protocol('WM_DELETE_WINDOW', on_close)
+root.after(POLL_MS, _poll_jobs)
 root.mainloop()
 
@@ -0,0 +1,316 @@
+"""Leased job queue on shared storage for running several worker nodes.
+
+Jobs live in a SQLite file on the shared volume next to ``downloads/``. A
+worker claims a job by taking a time-limited lease, renews it with
+heartbeats while the handler runs, and marks it done or failed. If a worker
+dies its lease expires and the next ``claim`` hands the job to someone else.
+No broker or external service is involved.
+
+    python jobs.py worker              # process jobs with main.JOB_HANDLERS
+    python jobs.py status              # queue counts
+    python jobs.py demo --workers 4    # local multi-process lease/crash demo
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60.0
+POLL_SECONDS = 1.0
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    result TEXT,
+    error TEXT,
+    collected INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, lease_until);
+"""
+
+
+def default_worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobQueue:
+    """SQLite-backed job queue with leases.
+
+    Every state change runs in a ``BEGIN IMMEDIATE`` transaction, so claims
+    are atomic across processes and machines sharing the file. The database
+    uses rollback-journal mode because WAL does not work on network shares.
+    """
+
+    def __init__(self, path: Path, timeout: float = 30.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA journal_mode=DELETE')
+        return db
+
+    def _tx(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        db = self._connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(db)
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+            return result
+        finally:
+            db.close()
+
+    def enqueue(self, kind: str, payload: dict, key: str | None = None,
+                max_attempts: int = MAX_ATTEMPTS) -> str:
+        """Queue a job; a finished job with the same ``key`` is re-queued."""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+
+        def run(db: sqlite3.Connection) -> str:
+            if key is not None:
+                row = db.execute('SELECT id, status FROM jobs WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    if row['status'] in ('queued', 'leased'):
+                        return row['id']
+                    db.execute(
+                        "UPDATE jobs SET kind = ?, payload = ?, status = 'queued', worker = NULL, "
+                        'lease_until = NULL, attempts = 0, max_attempts = ?, result = NULL, '
+                        'error = NULL, collected = 0, updated_at = ? WHERE id = ?',
+                        (kind, json.dumps(payload), max_attempts, now, row['id']))
+                    return row['id']
+            db.execute(
+                'INSERT INTO jobs (id, kind, key, payload, max_attempts, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, key, json.dumps(payload), max_attempts, now, now))
+            return job_id
+
+        return self._tx(run)
+
+    def claim(self, worker: str, kinds: list[str] | None = None,
+              lease: float = LEASE_SECONDS) -> dict | None:
+        """Lease the oldest runnable job, reclaiming ones whose lease expired."""
+        now = time.time()
+
+        def run(db: sqlite3.Connection) -> dict | None:
+            # Expired leases that used up their attempts are failed, not retried.
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = coalesce(error, 'lease expired'), "
+                "updated_at = ? WHERE status = 'leased' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now))
+            sql = ("SELECT * FROM jobs WHERE (status = 'queued' OR (status = 'leased' AND lease_until < ?))")
+            args: list[Any] = [now]
+            if kinds:
+                sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+                args += kinds
+            row = db.execute(sql + ' ORDER BY created_at LIMIT 1', args).fetchone()
+            if row is None:
+                return None
+            if row['status'] == 'leased':
+                logger.warning('reclaiming job %s from %s', row['id'], row['worker'])
+            db.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, "
+                'attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                (worker, now + lease, now, row['id']))
+            job = dict(row)
+            job['payload'] = json.loads(job['payload'])
+            job['attempts'] += 1
+            job['previous_worker'] = row['worker']
+            return job
+
+        return self._tx(run)
+
+    def heartbeat(self, job_id: str, worker: str, lease: float = LEASE_SECONDS) -> bool:
+        """Extend the lease; ``False`` means the job was lost to another worker."""
+        now = time.time()
+        return self._tx(lambda db: db.execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now + lease, now, job_id, worker)).rowcount == 1)
+
+    def complete(self, job_id: str, worker: str, result: Any = None) -> bool:
+        return self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_until = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (json.dumps(result), time.time(), job_id, worker)).rowcount == 1)
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        """Record a failure; the job is re-queued until ``max_attempts``."""
+        return self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+            'error = ?, worker = NULL, lease_until = NULL, updated_at = ? '
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (error, time.time(), job_id, worker)).rowcount == 1)
+
+    def collect(self, kind: str | None = None) -> list[dict]:
+        """Return finished jobs not collected yet and mark them collected."""
+        def run(db: sqlite3.Connection) -> list[dict]:
+            sql = "SELECT * FROM jobs WHERE status IN ('done', 'failed') AND collected = 0"
+            args: list[Any] = []
+            if kind:
+                sql += ' AND kind = ?'
+                args.append(kind)
+            rows = [dict(r) for r in db.execute(sql, args)]
+            db.executemany('UPDATE jobs SET collected = 1 WHERE id = ?', [(r['id'],) for r in rows])
+            for r in rows:
+                r['payload'] = json.loads(r['payload'])
+                r['result'] = json.loads(r['result']) if r['result'] else None
+            return rows
+
+        return self._tx(run)
+
+    def counts(self) -> dict[str, int]:
+        with closing(self._connect()) as db:
+            return {r['status']: r['n'] for r in db.execute(
+                'SELECT status, count(*) AS n FROM jobs GROUP BY status')}
+
+
+def run_worker(queue: JobQueue, handlers: dict[str, Callable[[dict], Any]], *,
+               worker: str | None = None, lease: float = LEASE_SECONDS,
+               poll: float = POLL_SECONDS, stop: threading.Event | None = None,
+               max_jobs: int | None = None) -> int:
+    """Claim and run jobs until ``stop`` is set; returns the number processed."""
+    worker = worker or default_worker_id()
+    stop = stop or threading.Event()
+    done = 0
+    while not stop.is_set() and (max_jobs is None or done < max_jobs):
+        job = queue.claim(worker, list(handlers), lease)
+        if job is None:
+            stop.wait(poll)
+            continue
+        beating = threading.Event()
+
+        def beat(job_id: str = job['id']) -> None:
+            while not beating.wait(lease / 3):
+                if not queue.heartbeat(job_id, worker, lease):
+                    logger.warning('lost lease on job %s', job_id)
+                    return
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        try:
+            result = handlers[job['kind']](job['payload'])
+        except Exception as e:
+            logger.exception('job %s failed', job['id'])
+            beating.set()
+            queue.fail(job['id'], worker, str(e))
+        else:
+            beating.set()
+            if not queue.complete(job['id'], worker, result):
+                logger.warning('job %s finished after its lease was taken over', job['id'])
+        heart.join()
+        done += 1
+    return done
+
+
+# ---------------------------------------------------------------------------
+# CLI and local multi-process demo
+
+
+def _demo_sleep(payload: dict) -> dict:
+    if payload.get('crash_once') and not Path(payload['marker']).exists():
+        Path(payload['marker']).touch()
+        os._exit(1)  # simulate a node dying mid-job
+    time.sleep(payload.get('seconds', 0.1))
+    return {'worker': default_worker_id()}
+
+
+def _demo_worker(db: str, lease: float) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    run_worker(JobQueue(Path(db)), {'demo': _demo_sleep}, lease=lease, poll=0.1)
+
+
+def _demo(args: argparse.Namespace) -> None:
+    import tempfile
+    tmp = Path(tempfile.mkdtemp(prefix='ecs_jobs_'))
+    queue = JobQueue(tmp / 'jobs.db')
+    for i in range(args.jobs):
+        queue.enqueue('demo', {'seconds': 0.2, 'crash_once': i == 0, 'marker': str(tmp / 'crashed')},
+                      key=f'demo:{i}')
+    ctx = multiprocessing.get_context('spawn')
+    procs = [ctx.Process(target=_demo_worker, args=(str(queue.path), args.lease)) for _ in range(args.workers)]
+    t0 = time.time()
+    for p in procs:
+        p.start()
+    finished: list[dict] = []
+    while len(finished) < args.jobs and time.time() - t0 < 120:
+        finished += queue.collect('demo')
+        time.sleep(0.2)
+    for p in procs:
+        p.terminate()
+        p.join()
+    per_worker: dict[str, int] = {}
+    for job in finished:
+        w = (job['result'] or {}).get('worker', job['status'])
+        per_worker[w] = per_worker.get(w, 0) + 1
+    retried = sum(1 for j in finished if j['attempts'] > 1)
+    print(f'{len(finished)}/{args.jobs} jobs finished in {time.time() - t0:.1f}s, '
+          f'{retried} reclaimed after a crashed worker')
+    for w, n in sorted(per_worker.items()):
+        print(f'  {w}: {n}')
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Endless Chapters job queue')
+    parser.add_argument('--db', help='queue database (default: main.JOBS_DB)')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    w = sub.add_parser('worker', help='process storybook jobs')
+    w.add_argument('--lease', type=float, default=LEASE_SECONDS)
+    w.add_argument('--id', help='worker id (default host:pid)')
+    sub.add_parser('status', help='show job counts')
+    d = sub.add_parser('demo', help='multi-process lease/crash demo')
+    d.add_argument('--workers', type=int, default=4)
+    d.add_argument('--jobs', type=int, default=40)
+    d.add_argument('--lease', type=float, default=2.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.cmd == 'demo':
+        _demo(args)
+        return
+    if args.db:
+        db = Path(args.db)
+    else:
+        from main import JOBS_DB
+        db = JOBS_DB
+    queue = JobQueue(db)
+    if args.cmd == 'status':
+        print(json.dumps(queue.counts(), indent=2))
+        return
+    from main import JOB_HANDLERS
+    logger.info('worker %s polling %s', args.id or default_worker_id(), db)
+    run_worker(queue, JOB_HANDLERS, worker=args.id, lease=args.lease)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Local load test for the public delivery routes (see ``delivery.py``).
+
+Starts uvicorn with only the delivery router over a throwaway downloads
+directory and hammers it with concurrent clients the way phones scanning a
+batch of QR codes would: landing page, audio seeks (Range), revalidation
+(If-None-Match) and full book downloads.
+
+    python loadtest_delivery.py --clients 200 --requests 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from delivery import ArtifactIndex, create_router
+
+
+def _make_fixture(root: Path, orders: int, audio_mb: int) -> list[str]:
+    names = []
+    for i in range(orders):
+        order = str(5000 + i)
+        work = root / f'order_{order}_{i}'
+        (work / 'audio').mkdir(parents=True)
+        (work / 'docs').mkdir()
+        (work / 'audio' / 'voice.mp3').write_bytes(os.urandom(audio_mb * 1024 * 1024))
+        (work / 'docs' / 'book.pdf').write_bytes(os.urandom(2 * 1024 * 1024))
+        manifest = {'order': order, 'generated_at': '2024-01-01T00:00:00',
+                    'docs': {'book': 'docs/book.pdf'}, 'audio': 'audio/voice.mp3'}
+        (work / 'manifest.json').write_text(json.dumps(manifest), encoding='utf-8')
+        names.append(order)
+    return names
+
+
+async def _client(base: str, index: ArtifactIndex, orders: list[str], n: int,
+                  timings: dict[str, list[float]], errors: list[str]) -> None:
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        for _ in range(n):
+            order = random.choice(orders)
+            entry = index.get(order)
+            audio = f"/downloads/{entry['dir']}/{entry['audio']}"
+            book = f"/downloads/{entry['dir']}/{entry['book']}"
+            action = random.choices(['landing', 'seek', 'revalidate', 'book'], [3, 5, 2, 1])[0]
+            t0 = time.perf_counter()
+            if action == 'landing':
+                r = await client.get(f'/o/{order}')
+                ok = r.status_code == 200
+            elif action == 'seek':
+                start = random.randrange(0, 1024 * 1024)
+                r = await client.get(audio, headers={'Range': f'bytes={start}-{start + 256 * 1024 - 1}'})
+                ok = r.status_code == 206 and len(r.content) == 256 * 1024
+            elif action == 'revalidate':
+                head = await client.head(audio)
+                r = await client.get(audio, headers={'If-None-Match': head.headers['etag']})
+                ok = r.status_code == 304
+            else:
+                r = await client.get(book)
+                ok = r.status_code == 200
+            timings[action].append(time.perf_counter() - t0)
+            if not ok:
+                errors.append(f'{action}: HTTP {r.status_code}')
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+async def run(args: argparse.Namespace) -> None:
+    root = Path(tempfile.mkdtemp(prefix='ecs_delivery_'))
+    orders = _make_fixture(root, args.orders, args.audio_mb)
+    index = ArtifactIndex(root)
+    index.scan()
+    app = FastAPI()
+    app.include_router(create_router(index))
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=args.port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    timings: dict[str, list[float]] = defaultdict(list)
+    errors: list[str] = []
+    base = f'http://127.0.0.1:{args.port}'
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(base, index, orders, args.requests, timings, errors)
+                           for _ in range(args.clients)))
+    elapsed = time.perf_counter() - t0
+    server.should_exit = True
+    thread.join()
+    shutil.rmtree(root, ignore_errors=True)
+
+    total = sum(len(v) for v in timings.values())
+    print(f'{total} requests from {args.clients} clients in {elapsed:.2f}s '
+          f'({total / elapsed:.0f} req/s), {len(errors)} errors')
+    print(f"{'action':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for action, values in sorted(timings.items()):
+        print(f'{action:<12}{len(values):>8}{_pct(values, .5):>10.1f}{_pct(values, .95):>10.1f}'
+              f'{_pct(values, .99):>10.1f}{statistics.fmean(values) * 1000:>10.1f}')
+    for e in errors[:10]:
+        print('  ', e)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--orders', type=int, default=10)
+    parser.add_argument('--audio-mb', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8099)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,439 @@
+"""Concurrent-operator load test for the NiceGUI app (``main.py``).
+
+Starts the real app in a child process over a throwaway ``ECS_SHARED_DIR``
+and drives it with N simulated operators. Each one loads the page and keeps
+a Socket.IO session open like a browser tab, then imports CSVs through the
+upload widget, clicks the status buttons to walk its orders through the
+workflow (NotebookLM, Storybook, storybook upload with synthetic PDFs,
+DONE), refreshes, searches and exports the CSV. Reports latency
+percentiles per action, the server's event-loop lag and its memory growth.
+
+    python loadtest_server.py --operators 10 --actions 30
+    python loadtest_server.py --operators 20 --actions 50 --json results.json
+
+A click is timed until the server acknowledges the event (synchronous
+handlers such as DONE and REFRESCAR) or until the operator receives the
+notification that ends it (NotebookLM, Storybook, uploads, imports).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+import httpx
+import pikepdf
+import socketio
+
+from orders import books_for_cover, pages_for_cover
+
+POINTS_PER_INCH = 72.0
+COVERS = ('Premium Hardcover', 'Hardcover', 'Softcover')
+# Status -> (table event, action name, status after it)
+WORKFLOW = {
+    'Pending to NotebookLM': ('open_notebooklm', 'notebooklm', 'Pending to Storybook'),
+    'Pending to Storybook': ('open_storybook', 'storybook', 'Pending storybook upload'),
+    'Pending storybook upload': ('upload_storybook', 'upload', 'Pending yo revise PDF'),
+    'Pending yo revise PDF': ('mark_done', 'done', 'DONE'),
+}
+ACTIONS = {'import': 1, 'advance': 6, 'refresh': 2, 'search': 2, 'export': 1}
+STORY = ('Cada verano {name} visita a su abuela junto al mar. Juntas recogen conchas, '
+         'cuentan estrellas y escriben cartas a los delfines que nunca responden. ')
+
+
+# ---------------------------------------------------------------------------
+# Server side (``--serve``): the app plus an event-loop probe
+
+
+class LoopProbe:
+    """Measures how late the event loop wakes up from short sleeps."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.lags: list[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - t0 - self.interval))
+
+    def take(self) -> list[float]:
+        lags, self.lags = self.lags, []
+        return lags
+
+
+def _rss() -> int:
+    try:
+        import psutil  # type: ignore
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def serve(port: int) -> None:
+    import main
+    from nicegui import Client, app, ui
+
+    # Operators' clicks must not open browser tabs or touch the clipboard.
+    main.webbrowser.open = lambda *a, **k: True
+    main.pyperclip.copy = lambda text: None
+    probe = LoopProbe()
+    app.on_startup(probe.run)
+
+    @app.get('/_loadtest/stats')
+    def stats() -> dict[str, Any]:
+        return {'lags': probe.take(), 'rss': _rss(), 'orders': len(main.ORDERS),
+                'downloads': len(main.DOWNLOADS), 'clients': len(Client.instances)}
+
+    ui.run(port=port, reload=False, show=False, reconnect_timeout=30)
+
+
+# ---------------------------------------------------------------------------
+# Client side: simulated operators
+
+
+def _csv(batch: str, rows: int, rng: random.Random) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['order', 'client', 'email', 'cover', 'tags', 'personalized_characters',
+                     'narration', 'revisions', 'story'])
+    for i in range(rows):
+        name = rng.choice(['Lucía', 'Mateo', 'Sofía', 'Hugo', 'Martina', 'Leo'])
+        writer.writerow([f'{batch}{i:03d}', name, f'{name.lower()}.{batch}{i}@correo.es',
+                         rng.choice(COVERS), f'qr, {batch}', 0, 'Narrated by your loved one', 0,
+                         STORY.format(name=name) * rng.randint(1, 4)])
+    return out.getvalue().encode('utf-8')
+
+
+def _pdf(pages: int, page_size: tuple[float, float]) -> bytes:
+    pdf = pikepdf.new()
+    for i in range(pages):
+        page = pdf.add_blank_page(page_size=page_size)
+        page.Contents = pdf.make_stream(
+            f'0.9 0.85 0.7 rg 36 36 {page_size[0] - 72} {page_size[1] - 72} re f '
+            f'BT /F1 24 Tf 72 {page_size[1] / 2} Td (Pagina {i + 1}) Tj ET'.encode())
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=pikepdf.Dictionary(
+            Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica)))
+    out = io.BytesIO()
+    pdf.save(out)
+    return out.getvalue()
+
+
+def _page_elements(html: str) -> dict[str, Any]:
+    m = re.search(r'parseElements\(String\.raw`(.*?)`\)', html, re.S)
+    if not m:
+        raise RuntimeError('page without NiceGUI elements')
+    return json.loads(m.group(1))
+
+
+def _listeners(element: dict[str, Any]) -> dict[str, str]:
+    return {e['type']: e['listener_id'] for e in element.get('events', [])}
+
+
+class Operator:
+    """One browser tab: page load, Socket.IO session and a random workload."""
+
+    def __init__(self, n: int, base: str, args: argparse.Namespace,
+                 timings: dict[str, list[float]], errors: list[str], pdfs: dict[int, bytes]) -> None:
+        self.n = n
+        self.base = base
+        self.args = args
+        self.timings = timings
+        self.errors = errors
+        self.pdfs = pdfs
+        self.rng = random.Random(args.seed * 1000 + n)
+        self.http = httpx.AsyncClient(base_url=base, timeout=args.timeout)
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.orders: dict[str, dict[str, Any]] = {}
+        self.notes: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self.uploads: asyncio.Queue[str] = asyncio.Queue()
+        self.next_message_id = 0
+        self.batches = 0
+
+    # -- session ---------------------------------------------------------
+
+    async def open(self) -> None:
+        t0 = time.perf_counter()
+        r = await self.http.get('/')
+        r.raise_for_status()
+        elements = _page_elements(r.text)
+        self.client_id = re.search(r"'client_id': '([^']+)'", r.text).group(1)
+        for eid, el in elements.items():
+            events = _listeners(el)
+            if 'mark_done' in events:
+                self.table_id, self.table_events = int(eid), events
+            elif el.get('tag') == 'nicegui-upload' and '.csv' in el['props'].get('accept', ''):
+                self.import_url = el['props']['url']
+            elif el.get('props', {}).get('label') == 'REFRESCAR':
+                self.refresh_id, self.refresh_listener = int(eid), events['click']
+
+        @self.sio.on('update')
+        def on_update(data: dict[str, Any]) -> None:
+            self._seen(data)
+            for el in data.values():
+                if isinstance(el, dict) and el.get('tag') == 'nicegui-upload' and '.pdf' in el['props'].get('accept', ''):
+                    self.uploads.put_nowait(el['props']['url'])
+
+        @self.sio.on('notify')
+        def on_notify(data: dict[str, Any]) -> None:
+            self._seen(data)
+            self.notes.put_nowait(data)
+
+        @self.sio.on('*')
+        def on_other(event: str, data: Any) -> None:
+            if isinstance(data, dict):
+                self._seen(data)
+
+        query = {'client_id': self.client_id, 'tab_id': str(uuid.uuid4()), 'document_id': str(uuid.uuid4()),
+                 'next_message_id': 0, 'implicit_handshake': 'true'}
+        await self.sio.connect(f'{self.base}?{httpx.QueryParams(query)}', transports=['websocket'],
+                               socketio_path='/_nicegui_ws/socket.io')
+        self.timings['page'].append(time.perf_counter() - t0)
+        self._acker = asyncio.create_task(self._ack_loop())
+
+    def _seen(self, data: dict[str, Any]) -> None:
+        if isinstance(data.get('_id'), int):
+            self.next_message_id = max(self.next_message_id, data['_id'] + 1)
+
+    async def _ack_loop(self) -> None:
+        # Browsers ack every 3 s so the server can prune its message history.
+        while True:
+            await asyncio.sleep(3)
+            await self.sio.emit('ack', {'client_id': self.client_id, 'next_message_id': self.next_message_id})
+
+    async def close(self) -> None:
+        self._acker.cancel()
+        await self.sio.disconnect()
+        await self.http.aclose()
+
+    # -- helpers ---------------------------------------------------------
+
+    async def _event(self, element_id: int, listener_id: str, args: list[Any]) -> None:
+        await self.sio.call('event', {'id': element_id, 'client_id': self.client_id,
+                                      'listener_id': listener_id, 'args': [json.dumps(a) for a in args]},
+                            timeout=self.args.timeout)
+
+    async def _note(self) -> dict[str, Any]:
+        return await asyncio.wait_for(self.notes.get(), self.args.timeout)
+
+    def _drain(self) -> None:
+        while not self.notes.empty():
+            self.notes.get_nowait()
+
+    # -- actions ---------------------------------------------------------
+
+    async def do_import(self) -> bool:
+        self.batches += 1
+        batch = f'lt{self.n}x{self.batches}z'
+        data = _csv(batch, self.args.import_rows, self.rng)
+        r = await self.http.post(self.import_url, files={'file': (f'{batch}.csv', data, 'text/csv')})
+        if r.status_code != 200:
+            return False
+        note = await self._note()
+        if 'filas importadas' not in note.get('message', ''):
+            self.errors.append(f"import: {note.get('message')}")
+            return True
+        r = await self.http.get('/api/search', params={'q': f'tags:{batch}', 'limit': 10_000})
+        for row in r.json()['rows']:
+            self.orders[row['id']] = row
+        return True
+
+    async def do_advance(self) -> tuple[str, bool]:
+        pending = [r for r in self.orders.values() if r['status'] in WORKFLOW]
+        row = self.rng.choice(pending)
+        event, action, after = WORKFLOW[row['status']]
+        args = [row['id']]
+        if action == 'done':
+            await self._event(self.table_id, self.table_events[event], args)
+        elif action == 'upload':
+            await self._event(self.table_id, self.table_events[event], args)
+            url = await asyncio.wait_for(self.uploads.get(), self.args.timeout)
+            books = books_for_cover(row['cover'])
+            pages = pages_for_cover(row['cover'])
+            for i in range(books):
+                files = {'file': (f"storybook_{row['order']}_{i + 1}.pdf", self.pdfs[pages], 'application/pdf')}
+                r = await self.http.post(url, files=files)
+                if r.status_code != 200:
+                    return action, False
+            note = await self._note()
+            if note.get('type') == 'negative':
+                self.errors.append(f"upload {row['order']}: {note.get('message')}")
+                return action, True
+        else:
+            await self._event(self.table_id, self.table_events[event], args)
+            note = await self._note()
+            if note.get('type') == 'negative':
+                self.errors.append(f"{action} {row['order']}: {note.get('message')}")
+                return action, True
+        row['status'] = after
+        return action, True
+
+    async def run(self) -> None:
+        for _ in range(self.args.actions):
+            action = self.rng.choices(list(ACTIONS), list(ACTIONS.values()))[0]
+            if action == 'advance' and not any(r['status'] in WORKFLOW for r in self.orders.values()):
+                action = 'import'
+            self._drain()
+            t0 = time.perf_counter()
+            try:
+                if action == 'import':
+                    ok = await self.do_import()
+                elif action == 'advance':
+                    action, ok = await self.do_advance()
+                elif action == 'refresh':
+                    await self._event(self.refresh_id, self.refresh_listener, [])
+                    ok = True
+                elif action == 'search':
+                    r = await self.http.get('/api/search', params={'q': self.rng.choice(['lucía', 'mar', 'hardcover'])})
+                    ok = r.status_code == 200
+                else:
+                    async with self.http.stream('GET', '/api/export.csv') as r:
+                        async for _ in r.aiter_bytes():
+                            pass
+                    ok = r.status_code == 200
+            except (asyncio.TimeoutError, socketio.exceptions.TimeoutError, httpx.HTTPError) as e:
+                self.errors.append(f'{action}: {type(e).__name__} {e}')
+                continue
+            self.timings[action].append(time.perf_counter() - t0)
+            if not ok:
+                self.errors.append(f'{action}: failed')
+            await asyncio.sleep(self.rng.uniform(0, self.args.think))
+
+
+# ---------------------------------------------------------------------------
+# Driver
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0.0
+
+
+async def _stats(client: httpx.AsyncClient) -> dict[str, Any]:
+    return (await client.get('/_loadtest/stats')).json()
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    shared = Path(tempfile.mkdtemp(prefix='ecs_loadtest_'))
+    env = {**os.environ, 'ECS_SHARED_DIR': str(shared), 'ECS_DISTRIBUTED': '', 'VOICE_PROVIDER': 'offline'}
+    server = subprocess.Popen([sys.executable, __file__, '--serve', '--port', str(args.port)],
+                              cwd=Path(__file__).parent, env=env,
+                              stdout=subprocess.DEVNULL if not args.verbose else None,
+                              stderr=subprocess.DEVNULL if not args.verbose else None)
+    base = f'http://127.0.0.1:{args.port}'
+    lags: list[float] = []
+    samples: list[dict[str, Any]] = []
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=args.timeout) as http:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    before = await _stats(http)
+                    break
+                except httpx.HTTPError:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError('the app did not start; run with --verbose to see why')
+                    await asyncio.sleep(0.25)
+
+            size = (6 * POINTS_PER_INCH, 9 * POINTS_PER_INCH)
+            pdfs = {pages: _pdf(pages, size) for pages in (24, 32)}
+            timings: dict[str, list[float]] = defaultdict(list)
+            errors: list[str] = []
+            operators = [Operator(n, base, args, timings, errors, pdfs) for n in range(args.operators)]
+
+            async def monitor() -> None:
+                while True:
+                    await asyncio.sleep(1)
+                    stats = await _stats(http)
+                    lags.extend(stats.pop('lags'))
+                    samples.append(stats)
+
+            watcher = asyncio.create_task(monitor())
+            t0 = time.perf_counter()
+            await asyncio.gather(*(op.open() for op in operators))
+            await asyncio.gather(*(op.run() for op in operators))
+            elapsed = time.perf_counter() - t0
+            watcher.cancel()
+            await asyncio.gather(*(op.close() for op in operators), return_exceptions=True)
+            after = await _stats(http)
+            lags.extend(after.pop('lags'))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(shared, ignore_errors=True)
+
+    peak = max([s['rss'] for s in samples] + [after['rss']])
+    return {
+        'operators': args.operators, 'actions': args.actions, 'elapsed_s': round(elapsed, 2),
+        'errors': errors,
+        'latency_ms': {a: {'count': len(v), 'p50': _pct(v, .5), 'p95': _pct(v, .95), 'p99': _pct(v, .99),
+                           'max': max(v) * 1000, 'mean': statistics.fmean(v) * 1000}
+                       for a, v in sorted(timings.items())},
+        'loop_lag_ms': {'p50': _pct(lags, .5), 'p95': _pct(lags, .95), 'p99': _pct(lags, .99),
+                        'max': max(lags, default=0) * 1000},
+        'memory_mb': {'start': before['rss'] / 2 ** 20, 'end': after['rss'] / 2 ** 20, 'peak': peak / 2 ** 20,
+                      'growth': (after['rss'] - before['rss']) / 2 ** 20},
+        'orders': after['orders'], 'downloads': after['downloads'],
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    total = sum(v['count'] for v in report['latency_ms'].values())
+    print(f"{total} actions from {report['operators']} operators in {report['elapsed_s']:.2f}s, "
+          f"{len(report['errors'])} errors")
+    print(f"{'action':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, v in report['latency_ms'].items():
+        print(f"{action:<12}{v['count']:>8}{v['p50']:>10.1f}{v['p95']:>10.1f}{v['p99']:>10.1f}{v['max']:>10.1f}")
+    lag = report['loop_lag_ms']
+    print(f"event-loop lag: p50 {lag['p50']:.1f} ms, p95 {lag['p95']:.1f} ms, "
+          f"p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms")
+    mem = report['memory_mb']
+    if mem['start']:
+        print(f"server RSS: {mem['start']:.0f} -> {mem['end']:.0f} MB (peak {mem['peak']:.0f} MB, "
+              f"{mem['growth']:+.0f} MB) with {report['orders']} orders, {report['downloads']} bundles")
+    for e in report['errors'][:10]:
+        print('  ', e)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--operators', type=int, default=10)
+    parser.add_argument('--actions', type=int, default=30, help='actions per operator')
+    parser.add_argument('--import-rows', type=int, default=20, help='orders per imported CSV')
+    parser.add_argument('--think', type=float, default=0.5, help='max pause between actions, seconds')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--json', type=Path, help='also write the report here, to compare releases')
+    parser.add_argument('--verbose', action='store_true', help="show the app's log")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.port)
+    else:
+        report = asyncio.run(run(args))
+        print_report(report)
+        if args.json:
+            args.json.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
@@ -1,19 +1,24 @@
 from __future__ import annotations
 
 import os
+import atexit
 import csv
 import json
 import logging
 import tempfile
 import uuid
-import zipfile
 import io
 import asyncio
 import webbrowser
 import shutil
+import sys
+import threading
+import time
 from pathlib import Path
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime
-from typing import Any, Iterable
+from urllib.parse import quote
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable
 
 import pandas as pd
 import qrcode
@@ -22,31 +27,102 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import LETTER
 from dotenv import load_dotenv
 
-from nicegui import ui, app, Client
+from nicegui import ui, app, background_tasks, Client, context
 from nicegui.events import UploadEventArguments
+from fastapi import Request
 from fastapi.responses import JSONResponse, StreamingResponse
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header  # type: ignore
 import pyperclip
 from sample_orders import get_sample_orders
+from pdf_encoder import Cancelled
 from postprocess import postprocess_storybooks
+from audio import find_voice, probe_audio, stream_to_file, submit_finalize
+from delivery import ArtifactIndex, create_router
+from photos import PhotoCache, attach_photos, copy_photos
+from orders import LAZY_TEXT, OrderRecord, TextStore, books_for_cover, pages_for_cover
+from search import OrderIndex
+from preflight import check_storybooks, load_settings, parse_page_size
+from blobs import BlobStore
+from variants import parse_variant, parse_variants, variant_text
+from prompts import DEFAULT_VARIANT, KINDS, PromptCache, build_prompts, jsonl_lines
+from storage import StorageManager
+from jobs import JobQueue
 
 # ---------------------------------------------------------------------------
 # Environment & paths
+load_dotenv()
 BASE_DIR = Path(__file__).parent.resolve()
 ASSETS_DIR = BASE_DIR / 'assets'
-DOWNLOAD_DIR = BASE_DIR / 'downloads'
-DOWNLOAD_DIR.mkdir(exist_ok=True)
+LOGO_PATH = ASSETS_DIR / 'logo nuevo png.png'
+SETTINGS = load_settings(BASE_DIR / 'data' / 'settings.json')
+# Everything worker nodes need to see (downloads, temp uploads, job queue)
+# lives under SHARED_DIR; point it at a shared volume to run several nodes.
+SHARED_DIR = Path(os.getenv('ECS_SHARED_DIR') or BASE_DIR)
+DOWNLOAD_DIR = SHARED_DIR / 'downloads'
+DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+PHOTO_CACHE_DIR = SHARED_DIR / 'cache' / 'photos'
+TMP_DIR = SHARED_DIR / 'cache' / 'tmp'
+JOBS_DB = SHARED_DIR / 'cache' / 'jobs.db'
+# Artifacts are stored once and hardlinked into work dirs, so keep this on
+# the same filesystem as DOWNLOAD_DIR.
+BLOB_DIR = SHARED_DIR / 'cache' / 'blobs'
+# When enabled, storybook post-processing is queued for `python jobs.py worker`.
+DISTRIBUTED = os.getenv('ECS_DISTRIBUTED', '').lower() in {'1', 'true', 'yes'}
 
-load_dotenv()
 VOICE_PROVIDER = os.getenv('VOICE_PROVIDER', 'offline').lower()
 XI_API_KEY = os.getenv('XI_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 BASE_PUBLIC_URL = os.getenv('BASE_PUBLIC_URL', 'http://localhost:8080')
+# Storage lifecycle; 0 disables the quota / age limit.
+STORAGE_QUOTA_GB = float(os.getenv('STORAGE_QUOTA_GB', '0'))
+STORAGE_MAX_AGE_DAYS = float(os.getenv('STORAGE_MAX_AGE_DAYS', '0'))
+STORAGE_SWEEP_SECONDS = float(os.getenv('STORAGE_SWEEP_SECONDS', '600'))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# serve downloads statically
-app.add_static_files('/downloads', str(DOWNLOAD_DIR))
+# public delivery of generated artifacts (Range/ETag aware) and QR landing pages
+ARTIFACTS = ArtifactIndex(DOWNLOAD_DIR)
+ARTIFACTS.scan()
+app.include_router(create_router(ARTIFACTS))
+
+BLOBS = BlobStore(BLOB_DIR)
+
+STORAGE = StorageManager(
+    DOWNLOAD_DIR, TMP_DIR,
+    quota_bytes=int(STORAGE_QUOTA_GB * 1024 ** 3) or None,
+    max_age=STORAGE_MAX_AGE_DAYS * 86400 or None,
+    statuses=lambda: {r['id']: r.get('status', '') for r in ORDERS},
+    on_evict=ARTIFACTS.remove_dir,
+    blobs=BLOBS,
+)
+app.on_startup(lambda: STORAGE.start(STORAGE_SWEEP_SECONDS))
+app.on_shutdown(STORAGE.stop)
+
+PHOTO_CACHE = PhotoCache(PHOTO_CACHE_DIR, max_connections=int(os.getenv('PHOTO_CONNECTIONS', '8')))
+
+QUEUE = JobQueue(JOBS_DB) if DISTRIBUTED else None
+
+# Long order texts (story, NotebookLM prompt, narration) are kept on disk,
+# local to this process, instead of in every in-memory row. The file lives in
+# a tracked temp dir, so the sweeper removes it if the process dies uncleanly.
+TEXTS_DIR = STORAGE.make_temp_dir('texts-')
+atexit.register(STORAGE.release_temp_dir, TEXTS_DIR)
+OrderRecord.texts = TextStore(TEXTS_DIR / 'order_texts.db')
+# Full-text index for the search box and /api/search, kept in sync on import
+# and on every status change. It is rebuilt on import, so it stays in memory.
+SEARCH = OrderIndex()
+OrderRecord.status_listeners.append(SEARCH.update_status)
+# Statuses are also kept in each bundled work dir's manifest, so the storage
+# sweeper still knows which orders are in progress after a restart.
+OrderRecord.status_listeners.append(STORAGE.record_status)
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', '200'))
+# Story prompts for the JSONL export, on disk next to the CLI's; NotebookLM
+# prompts are not cached because every order already keeps its notebook_text.
+PROMPTS = PromptCache(BASE_DIR / 'cache' / 'prompts')
 
 # ---------------------------------------------------------------------------
 # Utility helpers
@@ -75,18 +151,11 @@ def simple_pdf(texts: list[str], out_pdf: Path, qr_png: Path | None = None) -> N
         c.showPage()
     c.save()
 
-def zip_dir(src: Path, zip_path: Path) -> None:
-    ensure_dir(zip_path.parent)
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
-        for p in src.rglob('*'):
-            if p.is_file():
-                z.write(p, p.relative_to(src))
-
-
 # ---------------------------------------------------------------------------
 # Data model in memory
 
-ORDERS: list[dict[str, Any]] = []
+ORDERS: list[OrderRecord] = []
+ORDERS_BY_ID: dict[str, OrderRecord] = {}
 DOWNLOADS: list[dict[str, Any]] = []
 
 
@@ -118,42 +187,107 @@ def _val(data: dict, names: Iterable[str]) -> Any:
         if n in data and pd.notna(data[n]):
             return data[n]
     return None
-  
-def books_for_cover(cover: str) -> int:
-    return 2 if cover.lower() == 'premium hardcover' else 1
 
 
-def pages_for_cover(cover: str) -> int:
-    return 24 if cover.lower() == 'premium hardcover' else 32
+def preflight_storybook(row: dict, pdf_paths: list[Path], expected_files: int | None = None) -> list[str]:
+    """Check uploaded storybook PDFs against the order before any rendering.
 
+    Only structure is read (page count and trim boxes against
+    ``settings.json``), so a wrong upload is rejected in milliseconds.
+    """
+    pages = row.get('pages') or pages_for_cover(row.get('cover', ''))
+    page_size = parse_page_size(SETTINGS.get('page_size', '6x9'))
+    bleed = float(SETTINGS.get('cover_bleed_inch', 0)) * 72
+    return check_storybooks(pdf_paths, expected_files=expected_files, pages=pages,
+                            page_size=page_size, bleed=bleed)
+
+
+def notebook_prompts(rows: list[dict]) -> list[str]:
+    """NotebookLM prompts (story plus notes for custom characters) for ``rows``.
+
+    Built from the precompiled templates in ``prompts.py``. They are not
+    cached: each order stores the result as ``notebook_text`` in the text store.
+    """
+    return [p['prompt'] for p in build_prompts(rows, 'notebooklm')]
+
+
+def prepare_notebook_texts(rows: list[dict]) -> None:
+    """Prepare the NotebookLM text of a batch of orders using the client's story."""
+    for row, text in zip(rows, notebook_prompts(rows)):
+        row['notebook_text'] = text
+        row['status'] = 'Pending to NotebookLM'
 
-def _build_notebook_text(row: dict) -> str:
-    """Return the client's story plus notes for custom characters."""
-    lines: list[str] = [
-        "Genera una historia a partir de la siguiente información:",
-    ]
-    cover = (row.get('cover') or '').lower()
-    photos = row.get('photos') or []
-    if cover == 'premium hardcover':
-        lines.append("La historia debe dividirse en dos partes.")
-    story = (row.get('story') or '').strip()
-    if story:
-        lines.append(story)
-    names = row.get('character_names') or []
-    if photos and names:
-        for name in names:
-            lines.append(
-                f"El personaje {name} tiene que ser el de la foto adjunta."
-            )
-    return "\n".join(lines).strip()
 
 def prepare_notebook_text(row: dict) -> None:
     """Prepare NotebookLM text using the client's story."""
-    row['notebook_text'] = _build_notebook_text(row)
-    row['status'] = 'Pending to NotebookLM'
+    prepare_notebook_texts([row])
+
 
+def add_orders(rows: list[OrderRecord]) -> None:
+    """Publish new orders to the working set and the search index."""
+    ORDERS.extend(rows)
+    ORDERS_BY_ID.update((r['id'], r) for r in rows)
+    SEARCH.add(rows)
 
-def parse_orders(temp_path: Path) -> list[dict]:
+
+def remove_orders(rows: list[OrderRecord]) -> None:
+    """Withdraw orders published by ``add_orders``, e.g. after a failed import."""
+    ids = {r['id'] for r in rows}
+    ORDERS[:] = [r for r in ORDERS if r['id'] not in ids]
+    for rid in ids:
+        ORDERS_BY_ID.pop(rid, None)
+    SEARCH.remove(ids)
+    for r in rows:
+        for field in LAZY_TEXT:
+            r.pop(field, None)
+
+
+def search_orders(text: str, limit: int = SEARCH_LIMIT) -> list[OrderRecord]:
+    """Orders matching ``text`` (see ``search.build_query``), newest first."""
+    return [ORDERS_BY_ID[rid] for rid in SEARCH.search(text, limit) if rid in ORDERS_BY_ID]
+
+
+def _to_int(value: Any) -> int:
+    return int(float(value or 0))
+
+
+def _order_from_record(data: dict, variant: tuple[list[str], dict] | None = None) -> OrderRecord:
+    """Build an order row from one spreadsheet record keyed by column name.
+
+    ``variant`` is the parsed tags of the record (see ``_orders_from_records``).
+    """
+    tags, spec = variant or parse_variant(_val(data, COL_ALIASES['tags']))
+    row = {
+        'id': str(uuid.uuid4()),
+        'created': str(_val(data, COL_ALIASES['created']) or datetime.now().date()),
+        'order': str(_val(data, COL_ALIASES['order']) or ''),
+        'client': str(_val(data, COL_ALIASES['client']) or ''),
+        'email': str(_val(data, COL_ALIASES['email']) or ''),
+        'cover': str(_val(data, COL_ALIASES['cover']) or ''),
+        'tags': tags,
+        'variant': spec,
+        'personalized_characters': _to_int(_val(data, COL_ALIASES['personalized_characters'])),
+        'narration': str(_val(data, COL_ALIASES['narration']) or ''),
+        'revisions': _to_int(_val(data, COL_ALIASES['revisions'])),
+        'voice_name': str(_val(data, COL_ALIASES['voice_name']) or ''),
+        'voice_seed': str(_val(data, COL_ALIASES['voice_seed']) or ''),
+        'voice_text': str(_val(data, COL_ALIASES['voice_text']) or ''),
+        'voice_sample': str(_val(data, COL_ALIASES['voice_sample']) or ''),
+        'story': str(_val(data, COL_ALIASES['story']) or ''),
+        'character_names': [n.strip() for n in str(_val(data, COL_ALIASES['character_names']) or '').split(',') if n.strip()],
+        'photos': [p.strip() for p in str(_val(data, COL_ALIASES['photos']) or '').split(',') if p.strip()],
+    }
+    row['pages'] = pages_for_cover(row['cover'])
+    return OrderRecord(row)
+
+
+def _orders_from_records(records: list[dict]) -> list[OrderRecord]:
+    """Build order rows for a batch, parsing the tags column in one pass."""
+    variants = parse_variants(_val(r, COL_ALIASES['tags']) for r in records)
+    return [_order_from_record(r, v) for r, v in zip(records, variants)]
+
+
+def parse_orders(temp_path: Path) -> list[OrderRecord]:
     if temp_path.suffix.lower() in {'.xlsx', '.xls'}:
         df = pd.read_excel(temp_path)
     else:
@@ -161,42 +295,170 @@ def parse_orders(temp_path: Path) -> list[dict]:
             df = pd.read_csv(temp_path, encoding='utf-8-sig')
         except Exception:
             df = pd.read_csv(temp_path, encoding='latin1')
-    rows: list[dict[str, Any]] = []
-    for _, r in df.iterrows():
-        data = r.to_dict()
-        row = {
-            'id': str(uuid.uuid4()),
-            'created': str(_val(data, COL_ALIASES['created']) or datetime.now().date()),
-            'order': str(_val(data, COL_ALIASES['order']) or ''),
-            'client': str(_val(data, COL_ALIASES['client']) or ''),
-            'email': str(_val(data, COL_ALIASES['email']) or ''),
-            'cover': str(_val(data, COL_ALIASES['cover']) or ''),
-            'tags': [t.strip() for t in str(_val(data, COL_ALIASES['tags']) or '').split(',') if t.strip()],
-            'personalized_characters': int(_val(data, COL_ALIASES['personalized_characters']) or 0),
-            'narration': str(_val(data, COL_ALIASES['narration']) or ''),
-            'revisions': int(_val(data, COL_ALIASES['revisions']) or 0),
-            'voice_name': str(_val(data, COL_ALIASES['voice_name']) or ''),
-            'voice_seed': str(_val(data, COL_ALIASES['voice_seed']) or ''),
-            'voice_text': str(_val(data, COL_ALIASES['voice_text']) or ''),
-            'voice_sample': str(_val(data, COL_ALIASES['voice_sample']) or ''),
-            'story': str(_val(data, COL_ALIASES['story']) or ''),
-            'character_names': [n.strip() for n in str(_val(data, COL_ALIASES['character_names']) or '').split(',') if n.strip()],
-            'photos': [p.strip() for p in str(_val(data, COL_ALIASES['photos']) or '').split(',') if p.strip()],
-        }
-        row['pages'] = pages_for_cover(row['cover'])
-        rows.append(row)
+    return _orders_from_records(df.to_dict('records'))
+
+
+class CsvStreamParser:
+    """Incremental CSV parser fed with raw bytes as they arrive.
+
+    Lines are decoded one by one (UTF-8, falling back to latin1 like
+    ``parse_orders``) and only complete records are handed to ``csv``, so
+    quoted fields spanning several lines are kept together.
+    """
+
+    def __init__(self) -> None:
+        self._tail = b''
+        self._pending: list[str] = []
+        self._quotes = 0
+        self._header: list[str] | None = None
+        self._first = True
+
+    def _decode(self, line: bytes) -> str:
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError:
+            text = line.decode('latin1')
+        if self._first:
+            self._first = False
+            text = text.lstrip('\ufeff')
+        return text
+
+    def _rows(self, lines: list[str]) -> list[dict]:
+        records: list[dict] = []
+        for values in csv.reader(lines):
+            if not values:
+                continue
+            if self._header is None:
+                self._header = [v.strip() for v in values]
+                continue
+            records.append({k: (v if v != '' else None) for k, v in zip(self._header, values)})
+        return _orders_from_records(records)
+
+    def _records(self, lines: list[bytes]) -> list[dict]:
+        complete: list[str] = []
+        for line in lines:
+            text = self._decode(line) + '\n'
+            self._pending.append(text)
+            self._quotes += text.count('"')
+            if self._quotes % 2 == 0:
+                complete.extend(self._pending)
+                self._pending.clear()
+                self._quotes = 0
+        return self._rows(complete)
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        """Consume a chunk and return the orders completed by it."""
+        lines = (self._tail + chunk).split(b'\n')
+        self._tail = lines.pop()
+        return self._records(lines)
+
+    def close(self) -> list[dict]:
+        """Flush the last unterminated line and any unbalanced record."""
+        lines = [self._tail] if self._tail.strip() else []
+        self._tail = b''
+        rows = self._records(lines)
+        leftover, self._pending, self._quotes = self._pending, [], 0
+        return rows + self._rows(leftover)
+
+
+IMPORT_CHUNK_SIZE = 64 * 1024
+
+
+async def import_orders_stream(
+    chunks: AsyncIterable[bytes],
+    filename: str,
+    on_progress: Callable[[int, list[dict]], None] | None = None,
+) -> list[dict]:
+    """Import orders from an upload stream, publishing rows as they are parsed.
+
+    CSV files are parsed incrementally; every batch of new rows is prepared
+    for NotebookLM, appended to ``ORDERS`` and reported through
+    ``on_progress(bytes_received, new_rows)``. Excel files need random access,
+    so they are spooled to a temporary file that is removed afterwards.
+
+    The import is all-or-nothing: if any part of the file fails, the rows
+    already published are withdrawn again before the error is raised.
+    """
+    rows: list[dict] = []
+    received = 0
+
+    def publish(new_rows: list[dict]) -> None:
+        prepare_notebook_texts(new_rows)
+        rows.extend(new_rows)
+        add_orders(new_rows)
+        if on_progress:
+            on_progress(received, new_rows)
+
+    try:
+        if Path(filename).suffix.lower() in {'.xlsx', '.xls'}:
+            fd, name = tempfile.mkstemp(suffix=Path(filename).suffix, dir=STORAGE.tmp_root)
+            temp_path = Path(name)
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    async for chunk in chunks:
+                        tmp.write(chunk)
+                        received += len(chunk)
+                        if on_progress:
+                            on_progress(received, [])
+                publish(await asyncio.to_thread(parse_orders, temp_path))
+            finally:
+                temp_path.unlink(missing_ok=True)
+            return rows
+
+        parser = CsvStreamParser()
+        async for chunk in chunks:
+            received += len(chunk)
+            publish(parser.feed(chunk))
+        publish(parser.close())
+    except BaseException:
+        remove_orders(rows)
+        raise
     return rows
 
 
+async def prefetch_photos(rows: list[dict]) -> None:
+    """Download the photos of ``rows`` into the cache and refresh their prompts."""
+    rows = [r for r in rows if r.get('photos')]
+    if not rows:
+        return
+    await asyncio.to_thread(attach_photos, rows, PHOTO_CACHE)
+    for r, text in zip(rows, notebook_prompts(rows)):
+        r['notebook_text'] = text
+
+
 # ---------------------------------------------------------------------------
 # Audio synthesis
 
 
-def synth_voice(row: dict, out_dir: Path) -> Path | None:
+def synth_voice(row: dict, out_dir: Path, cancel: threading.Event | None = None) -> Path | None:
+    """Synthesize the narration into ``out_dir`` and return the final audio file.
+
+    Provider responses are streamed to disk and every source is loudness
+    normalised and encoded to MP3 on the audio pool (see ``audio.py``).
+    ``cancel`` stops waiting for the encoder and raises ``JobCancelled``.
+    """
     if 'voice' not in row.get('tags', []) or not row.get('voice_text'):
         return None
+
+    def finalize(src: Path, out: Path) -> Path:
+        future = submit_finalize(src, out)
+        while True:
+            try:
+                return future.result(timeout=0.2)
+            except FutureTimeout:
+                if cancel is not None and cancel.is_set():
+                    future.cancel()
+                    raise JobCancelled(row['order']) from None
+
     ensure_dir(out_dir)
     out_path = out_dir / 'voice.mp3'
+    # Local engines write WAV (AIFF on macOS), never MP3.
+    raw_path = out_dir / ('voice.src.aiff' if sys.platform == 'darwin' else 'voice.src.wav')
+    # The final file may be a hardlink to a shared blob (see generate_order_bundle):
+    # engines only write the fresh ``voice.src.*`` files, which finalize
+    # then os.replace()s into place.
+    for stale in (raw_path, out_dir / 'voice.src.wav', out_dir / 'voice.src.mp3'):
+        stale.unlink(missing_ok=True)
     text = row['voice_text']
     provider = VOICE_PROVIDER
     try:
@@ -208,38 +470,38 @@ def synth_voice(row: dict, out_dir: Path) -> Path | None:
                     text=text,
                     speaker_wav=row['voice_sample'],
                     language="es",
-                    file_path=str(out_path),
+                    file_path=str(out_dir / 'voice.src.wav'),
                 )
-                return out_path
+                return finalize(out_dir / 'voice.src.wav', out_path)
             except Exception as e:
                 logger.warning('TTS voice clone unavailable: %s', e)
         if provider == 'elevenlabs' and XI_API_KEY:
-            import requests
             voice_id = row.get('voice_seed') or '21m00Tcm4TlvDq8ikWAM'
             url = f'https://api.elevenlabs.io/v1/text-to-speech/{voice_id}'
             headers = {'xi-api-key': XI_API_KEY}
             payload = {'text': text, 'voice_settings': {'stability': 0.3, 'similarity_boost': 0.8}}
-            r = requests.post(url, headers=headers, json=payload)
+            r = requests.post(url, headers=headers, json=payload, stream=True)
             if r.status_code != 200:
                 raise RuntimeError(r.text)
-            out_path.write_bytes(r.content)
-            return out_path
+            src = stream_to_file(r, out_dir / 'voice.src.mp3')
+            return finalize(src, out_path)
         if provider == 'openai' and OPENAI_API_KEY:
-            import requests
             voice = row.get('voice_name') or 'alloy'
             url = 'https://api.openai.com/v1/audio/speech'
             headers = {'Authorization': f'Bearer {OPENAI_API_KEY}'}
-            payload = {'model': 'tts-1', 'input': text, 'voice': voice}
-            r = requests.post(url, headers=headers, json=payload)
+            payload = {'model': 'tts-1', 'input': text, 'voice': voice, 'response_format': 'mp3'}
+            r = requests.post(url, headers=headers, json=payload, stream=True)
             if r.status_code != 200:
                 raise RuntimeError(r.text)
-            out_path.write_bytes(r.content)
-            return out_path
+            src = stream_to_file(r, out_dir / 'voice.src.mp3')
+            return finalize(src, out_path)
         import pyttsx3
         engine = pyttsx3.init()
-        engine.save_to_file(text, str(out_path))
+        engine.save_to_file(text, str(raw_path))
         engine.runAndWait()
-        return out_path
+        return finalize(raw_path, out_path)
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error('voice synth failed: %s', e)
         return None
@@ -249,16 +511,37 @@ def synth_voice(row: dict, out_dir: Path) -> Path | None:
 # Bundle generation
 
 
+def _write_artifact(path: Path, write: Callable[[Path], None]) -> str:
+    """Generate an artifact at ``path`` through ``write`` and store it as a blob.
+
+    ``path`` may already be a hardlink to a blob shared with other orders, so
+    it is never written in place: ``write`` gets a fresh temp file that then
+    replaces the link.
+    """
+    ensure_dir(path.parent)
+    tmp = path.with_name(f'.{path.stem}.{uuid.uuid4().hex}{path.suffix}')
+    try:
+        write(tmp)
+        return BLOBS.place(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
 def generate_order_bundle(row: dict, base_out: Path, storybook_pdf: Path | None = None) -> tuple[Path, Path]:
     work_dir = ensure_dir(base_out / f"order_{row['order']}_{row['id']}")
     docs_dir = ensure_dir(work_dir / 'docs')
     qr_dir = work_dir / 'qr'
     audio_dir = work_dir / 'audio'
 
+    blobs: dict[str, str] = {}
     audio_rel = None
-    audio_file = audio_dir / 'voice.mp3'
-    if audio_file.exists():
-        audio_rel = Path('audio/voice.mp3')
+    audio_file = find_voice(audio_dir)
+    if audio_file:
+        # replaced, never rewritten, by synth_voice, so adopting it is safe
+        audio_rel = Path('audio') / audio_file.name
+        blobs[audio_rel.as_posix()] = BLOBS.adopt(audio_file)
+
+    photo_files = [f'photos/{n}' for n in copy_photos(row, work_dir / 'photos')]
 
     qr_png = None
     if 'qr' in row.get('tags', []) or 'qr_audio' in row.get('tags', []):
@@ -266,48 +549,251 @@ def generate_order_bundle(row: dict, base_out: Path, storybook_pdf: Path | None
         if 'qr_audio' in row.get('tags', []) and audio_rel:
             qr_url = f'{BASE_PUBLIC_URL}/downloads/{work_dir.name}/{audio_rel.as_posix()}'
         qr_png = qr_dir / 'qr.png'
-        make_qr(qr_url, qr_png)
+        blobs['qr/qr.png'] = _write_artifact(qr_png, lambda p: make_qr(qr_url, p))
 
     book_pdf = docs_dir / 'book.pdf'
     if storybook_pdf and storybook_pdf.exists():
-        shutil.copy(storybook_pdf, book_pdf)
+        blobs['docs/book.pdf'] = BLOBS.place(storybook_pdf, book_pdf)
     else:
         texts = [
             f"Cover {row['order']} - {row['client']}",
             f"Interior {row['order']} - {row['client']}",
         ]
-        simple_pdf(texts, book_pdf, qr_png)
+        blobs['docs/book.pdf'] = _write_artifact(book_pdf, lambda p: simple_pdf(texts, p, qr_png))
 
     manifest = dict(row)
+    manifest.pop('photo_assets', None)
+    manifest.pop('bundled', None)
     manifest.update({
         'generated_at': datetime.now().isoformat(),
         'docs': {'book': 'docs/book.pdf'},
         'qr': 'qr/qr.png' if qr_png else None,
-        'audio': str(audio_rel) if audio_rel else None,
+        'photo_files': photo_files,
+        # the print variants are derived from the originals, so their hashes
+        # identify the photo set for the ZIP cache
+        'photo_sha256': [a['sha256'] for a in row.get('photo_assets') or []],
+        'audio': audio_rel.as_posix() if audio_rel else None,
+        'audio_info': probe_audio(audio_file) if audio_file else None,
+        'blobs': blobs,
     })
     (work_dir / 'manifest.json').write_text(
         json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    # from now on STORAGE.record_status keeps the manifest's status current
+    row['bundled'] = True
 
+    # An unchanged bundle reuses the ZIP built last time instead of recompressing.
     zip_path = base_out / f"order_{row['order']}.zip"
-    zip_dir(work_dir, zip_path)
+    BLOBS.zip_dir(work_dir, BLOBS.bundle_key(manifest), zip_path)
+    if base_out == DOWNLOAD_DIR:
+        ARTIFACTS.add(row['order'], work_dir, zip_path, manifest)
     return work_dir, zip_path
 
 
+class JobCancelled(Exception):
+    """Raised inside a storybook job when its cancel event is set."""
+
+
+def process_storybook(
+    row: dict,
+    pdf_paths: list[Path],
+    progress: Callable[[float, str], None] | None = None,
+    cancel: threading.Event | None = None,
+) -> dict:
+    """Post-process the uploaded storybooks, narrate and bundle one order.
+
+    ``progress(fraction, message)`` is called between steps and ``cancel`` is
+    checked there, per page while rendering and while narration is encoded,
+    so callers in other threads can follow or stop the job.
+    """
+    def step(fraction: float, message: str) -> None:
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled(row['order'])
+        if progress:
+            progress(fraction, message)
+
+    with STORAGE.temp_dir(f"render_{row['order']}_") as temp_dir:
+        final_pdf = temp_dir / 'storybook.pdf'
+        step(0.05, 'Procesando PDF')
+        try:
+            postprocess_storybooks(pdf_paths, final_pdf, LOGO_PATH, cancel)
+        except Cancelled:
+            raise JobCancelled(row['order']) from None
+        step(0.5, 'Narrando')
+        audio_dir = DOWNLOAD_DIR / f"order_{row['order']}_{row['id']}" / 'audio'
+        audio_path = synth_voice(row, audio_dir, cancel)
+        step(0.8, 'Empaquetando')
+        work_dir, zip_path = generate_order_bundle(row, DOWNLOAD_DIR, final_pdf)
+    if progress:
+        progress(1.0, 'Listo')
+    return {
+        'order': row['order'],
+        'zip': str(zip_path),
+        'dir': str(work_dir),
+        'audio': str(audio_path) if audio_path else None,
+    }
+
+
+def _storybook_job(payload: dict) -> dict:
+    result = process_storybook(payload['row'], [Path(p) for p in payload['pdfs']])
+    shutil.rmtree(payload['upload_dir'], ignore_errors=True)
+    return result
+
+
+# Job kinds handled by `python jobs.py worker` nodes.
+JOB_HANDLERS = {'storybook': _storybook_job}
+
+
+def _finish_storybook(row: dict | None, result: dict) -> None:
+    ARTIFACTS.load_dir(Path(result['dir']))
+    DOWNLOADS.append({'order': result['order'], 'zip': Path(result['zip']),
+                      'dir': Path(result['dir']), 'audio': result['audio']})
+    if row is not None:
+        row['status'] = 'Pending yo revise PDF'
+
+
+async def collect_jobs() -> None:
+    """Apply storybook jobs finished by worker nodes to the in-memory orders."""
+    while True:
+        try:
+            jobs = await asyncio.to_thread(QUEUE.collect, 'storybook')
+        except Exception:
+            logger.exception('job collection failed')
+            jobs = []
+        for job in jobs:
+            rid = job['payload']['row']['id']
+            row = ORDERS_BY_ID.get(rid)
+            if job['status'] == 'done':
+                _finish_storybook(row, job['result'])
+            else:
+                logger.error('storybook job for order %s failed: %s', job['payload']['row']['order'], job['error'])
+                if row is not None:
+                    row['status'] = 'Pending storybook upload'
+        if jobs and 'download_container' in globals():
+            refresh_table()
+            render_downloads()
+        await asyncio.sleep(2)
+
+
+if QUEUE is not None:
+    app.on_startup(collect_jobs)
+
+
 # ---------------------------------------------------------------------------
 # API endpoints
 
 
-@app.get('/api/import')
-def api_import(temp_path: str):
+async def _multipart_file(request: Request, meta: dict) -> AsyncIterator[bytes]:
+    """Yield the bytes of the first file part of a multipart request as they arrive.
+
+    ``meta['filename']`` is filled in as soon as the part headers are parsed,
+    i.e. before the first chunk is yielded.
+    """
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in params:
+        raise ValueError('Se esperaba multipart/form-data con un archivo')
+    state: dict[str, Any] = {'field': b'', 'value': b'', 'filename': None, 'active': False, 'done': False}
+    data: list[bytes] = []
+
+    def on_part_begin() -> None:
+        state['filename'] = None
+
+    def on_header_field(buf: bytes, start: int, end: int) -> None:
+        state['field'] += buf[start:end]
+
+    def on_header_value(buf: bytes, start: int, end: int) -> None:
+        state['value'] += buf[start:end]
+
+    def on_header_end() -> None:
+        if state['field'].lower() == b'content-disposition':
+            _, opts = parse_options_header(state['value'])
+            if b'filename' in opts:
+                state['filename'] = opts[b'filename'].decode('utf-8', 'replace')
+        state['field'] = state['value'] = b''
+
+    def on_headers_finished() -> None:
+        if state['filename'] and not state['done']:
+            meta['filename'] = state['filename']
+            state['active'] = True
+
+    def on_part_data(buf: bytes, start: int, end: int) -> None:
+        if state['active']:
+            data.append(buf[start:end])
+
+    def on_part_end() -> None:
+        if state['active']:
+            state['active'] = False
+            state['done'] = True
+
+    parser = MultipartParser(params[b'boundary'], {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        if data:
+            yield b''.join(data)
+            data.clear()
+    parser.finalize()
+    if data:
+        yield b''.join(data)
+    if 'filename' not in meta:
+        raise ValueError('No se recibió ningún archivo')
+
+
+@app.post('/api/import')
+async def api_import(request: Request):
+    """Import orders from a multipart upload, parsing it while it streams in."""
+    meta: dict[str, str] = {}
+    chunks = _multipart_file(request, meta)
     try:
-        rows = parse_orders(Path(temp_path))
-        for r in rows:
-            prepare_notebook_text(r)
-        ORDERS.extend(rows)
-        return {'rows': rows}
+        first = await anext(chunks, b'')
+
+        async def body() -> AsyncIterator[bytes]:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+
+        rows = await import_orders_stream(body(), meta.get('filename', ''))
+        background_tasks.create(prefetch_photos(rows), name='prefetch_photos')
+        return {'rows': [r.to_dict() for r in rows]}
     except Exception as e:
         logger.exception('import failed')
         return JSONResponse({'error': str(e)}, status_code=400)
+
+
+@app.get('/api/search')
+def api_search(q: str = '', limit: int = SEARCH_LIMIT):
+    """Search orders by number, client, email, story, tags, names or status."""
+    start = time.perf_counter()
+    rows = search_orders(q, min(limit, 1000))
+    return {'query': q, 'rows': [r.to_row() for r in rows],
+            'ms': round((time.perf_counter() - start) * 1000, 2)}
+
+
+@app.get('/api/prompts.jsonl')
+def api_prompts(kind: str = 'story', variant: str = DEFAULT_VARIANT, format: str = 'plain',
+                q: str = '', model: str = 'gpt-4o-mini'):
+    """Prompts of all (or the matching) orders as JSONL for a batch generation job."""
+    if kind not in KINDS or format not in {'plain', 'openai'}:
+        return JSONResponse({'error': f'kind debe ser {KINDS} y format plain u openai'}, status_code=400)
+    rows = search_orders(q) if q.strip() else list(ORDERS)
+    cache = PROMPTS if kind == 'story' else None
+    lines = jsonl_lines(build_prompts(rows, kind, variant, cache), format, model)
+    headers = {'Content-Disposition': f'attachment; filename="prompts_{kind}.jsonl"'}
+    return StreamingResponse(lines, media_type='application/x-ndjson', headers=headers)
+
+
+@app.get('/api/storage')
+def api_storage():
+    """Disk usage per order plus temp space, for capacity planning."""
+    return STORAGE.report()
+
+
 @app.get('/api/export.csv')
 def api_export_csv() -> StreamingResponse:
     def gen():
@@ -315,12 +801,14 @@ def api_export_csv() -> StreamingResponse:
         writer = csv.writer(output)
         writer.writerow(['created', 'order', 'client', 'email', 'cover',
                          'personalized_characters', 'narration', 'revisions',
-                         'status', 'tags', 'voice_name', 'voice_seed', 'voice_text'])
+                         'status', 'tags', 'variant', 'extras_total',
+                         'voice_name', 'voice_seed', 'voice_text'])
         for r in ORDERS:
             writer.writerow([
                 r['created'], r['order'], r['client'], r['email'], r['cover'],
                 r['personalized_characters'], r['narration'],
                 r['revisions'], r['status'], ','.join(r['tags']),
+                variant_text(r.get('variant')), (r.get('variant') or {}).get('extras_total', ''),
                 r['voice_name'], r['voice_seed'], r['voice_text'],
             ])
         yield output.getvalue()
@@ -331,39 +819,107 @@ def api_export_csv() -> StreamingResponse:
 # ---------------------------------------------------------------------------
 # UI
 
-table: ui.table
 download_container: ui.column
 
 
-def refresh_table() -> None:
-    table.rows = ORDERS
-    table.update()
-
-async def handle_upload(e: UploadEventArguments) -> None:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(e.name).suffix) as tmp:
-        tmp.write(e.content.read())
-        temp_path = Path(tmp.name)
-    from fastapi.testclient import TestClient
-    client = TestClient(app)
-    res = client.get('/api/import', params={'temp_path': str(temp_path)})
-    data = res.json()
-    if res.status_code != 200 or 'error' in data:
-        ui.notify(f"Error importando: {data.get('error', 'desconocido')}", type='negative')
+def refresh_table(client: Client | None = None) -> None:
+    """Show the current orders in ``client``'s table, or in every open page.
+
+    Each page keeps its own table and search text in ``client.storage``, so
+    one operator's search never filters another operator's table.
+    """
+    all_rows: list[dict] | None = None
+    for c in [client] if client else list(Client.instances.values()):
+        table = c.storage.get('table')
+        if table is None:
+            continue
+        text = c.storage.get('search', '')
+        if text.strip():
+            rows = [r.to_row() for r in search_orders(text)]
+        else:
+            if all_rows is None:
+                all_rows = [r.to_row() for r in ORDERS]
+            rows = all_rows
+        table.rows = rows
+        table.update()
+
+
+def set_search(client: Client, text: str | None) -> None:
+    client.storage['search'] = text or ''
+    refresh_table(client)
+
+def _upload_info(e: UploadEventArguments) -> tuple[str, int]:
+    """Name and size of an upload; NiceGUI 3 passes ``e.file``, NiceGUI 2 ``e.name``/``e.content``."""
+    if hasattr(e, 'file'):
+        return e.file.name, e.file.size()
+    e.content.seek(0, io.SEEK_END)
+    size = e.content.tell()
+    e.content.seek(0)
+    return e.name, size
+
+
+async def _iter_upload(e: UploadEventArguments) -> AsyncIterator[bytes]:
+    if hasattr(e, 'file'):
+        chunks = e.file.iterate(chunk_size=IMPORT_CHUNK_SIZE)
+    else:
+        chunks = _iter_file(e.content)
+    async for chunk in chunks:
+        yield chunk
+        await asyncio.sleep(0)
+
+
+async def _iter_file(f: Any) -> AsyncIterator[bytes]:
+    while chunk := f.read(IMPORT_CHUNK_SIZE):
+        yield chunk
+
+
+async def _save_upload(e: UploadEventArguments, path: Path) -> None:
+    if hasattr(e, 'file'):
+        await e.file.save(path)
+    else:
+        path.write_bytes(e.content.read())
+
+
+async def handle_upload(e: UploadEventArguments, progress: ui.linear_progress) -> None:
+    name, total = _upload_info(e)
+    total = total or 1
+    last_refresh = 0.0
+
+    def on_progress(received: int, new_rows: list[dict]) -> None:
+        nonlocal last_refresh
+        progress.value = received / total
+        now = asyncio.get_running_loop().time()
+        if new_rows and now - last_refresh > 0.25:
+            last_refresh = now
+            refresh_table()
+
+    progress.value = 0
+    progress.visible = True
+    try:
+        rows = await import_orders_stream(_iter_upload(e), name, on_progress)
+    except Exception as ex:
+        logger.exception('import failed')
+        ui.notify(f'Error importando (no se importó ninguna fila): {ex}', type='negative')
         return
-    ui.notify(f"{len(data['rows'])} filas importadas")
-    refresh_table()
+    finally:
+        progress.visible = False
+        refresh_table()
+    ui.notify(f"{len(rows)} filas importadas")
+    background_tasks.create(prefetch_photos(rows), name='prefetch_photos')
 
 
 def import_block() -> None:
     with ui.card().classes('p-4'):
         ui.label('Importar pedidos (CSV/Excel)')
-        ui.upload(on_upload=handle_upload, auto_upload=True).props('accept=.csv,.xlsx,.xls')
+        progress = ui.linear_progress(value=0, show_value=False)
+        progress.visible = False
+        ui.upload(on_upload=lambda e: handle_upload(e, progress), auto_upload=True).props('accept=.csv,.xlsx,.xls')
 
 
 async def load_sample_orders(client: Client) -> None:
-    samples = get_sample_orders()
-    await asyncio.gather(*(asyncio.to_thread(prepare_notebook_text, s) for s in samples))
-    ORDERS.extend(samples)
+    samples = [OrderRecord(s) for s in get_sample_orders()]
+    await asyncio.to_thread(prepare_notebook_texts, samples)
+    add_orders(samples)
     refresh_table()
     with client:
         ui.notify('Pedidos de prueba cargados')
@@ -384,7 +940,7 @@ def render_downloads() -> None:
                 if folder:
                     ui.link('Ver libro', f'/downloads/{folder}/docs/book.pdf', new_tab=True)
                     if d.get('audio'):
-                        ui.audio(f'/downloads/{folder}/audio/voice.mp3').props('controls')
+                        ui.audio(f"/downloads/{folder}/audio/{Path(d['audio']).name}").props('controls')
 
 
 async def open_storybook(row: dict, client: Client) -> None:
@@ -401,6 +957,12 @@ async def open_storybook(row: dict, client: Client) -> None:
 
 async def open_notebooklm(row: dict, client: Client) -> None:
     try:
+        if row.get('photos'):
+            await prefetch_photos([row])
+            photos_dir = DOWNLOAD_DIR / f"order_{row['order']}_{row['id']}" / 'photos'
+            if await asyncio.to_thread(copy_photos, row, photos_dir):
+                with client:
+                    ui.notify(f'Fotos para adjuntar en {photos_dir}')
         text = row.get('notebook_text', '')
         if text:
             pyperclip.copy(text)
@@ -417,27 +979,51 @@ async def open_notebooklm(row: dict, client: Client) -> None:
 async def upload_storybook(row: dict, client: Client) -> None:
     uploaded: list[Path] = []
     expected = books_for_cover(row.get('cover', ''))
-    dialog = ui.dialog()
+    with client:  # called from a task, outside the page's slot stack
+        dialog = ui.dialog()
+    temp_dir = STORAGE.make_temp_dir(f"storybook_{row['order']}_")
+
+    processing = False
 
     async def _on_upload(e: UploadEventArguments) -> None:
-        temp_dir = Path(tempfile.mkdtemp())
-        path = temp_dir / e.name
-        path.write_bytes(e.content.read())
+        nonlocal processing
+        path = temp_dir / Path(_upload_info(e)[0]).name
+        await _save_upload(e, path)
+        errors = await asyncio.to_thread(preflight_storybook, row, [path])
+        if errors:
+            path.unlink(missing_ok=True)
+            with client:
+                for message in errors:
+                    ui.notify(message, type='negative', multi_line=True)
+            return
         uploaded.append(path)
-        if len(uploaded) >= expected:
-            final_pdf = temp_dir / 'storybook.pdf'
-            postprocess_storybooks(uploaded, final_pdf, ASSETS_DIR / 'logo nuevo png.png')
-            audio_dir = DOWNLOAD_DIR / f"order_{row['order']}_{row['id']}" / 'audio'
-            audio_path = synth_voice(row, audio_dir)
-            work_dir, zip_path = generate_order_bundle(row, DOWNLOAD_DIR, final_pdf)
-            row['status'] = 'Pending yo revise PDF'
-            DOWNLOADS.append({'order': row['order'], 'zip': zip_path, 'dir': work_dir, 'audio': audio_path})
+        if len(uploaded) < expected or processing:
+            return
+        processing = True
+        if QUEUE is not None:
+            # Hand the upload dir over to whichever worker node claims the job.
+            STORAGE.release_temp_dir(temp_dir, delete=False)
+            payload = {'row': row.to_dict(), 'pdfs': [str(p) for p in uploaded], 'upload_dir': str(temp_dir)}
+            await asyncio.to_thread(QUEUE.enqueue, 'storybook', payload, f"storybook:{row['id']}")
+            row['status'] = 'Processing storybook'
             with client:
                 refresh_table()
-                render_downloads()
-                ui.notify('Postproducción completada, revisa el PDF')
+                ui.notify('Storybook en cola de procesamiento')
             dialog.close()
+            return
+        try:
+            result = await asyncio.to_thread(process_storybook, row, uploaded)
+        finally:
+            STORAGE.release_temp_dir(temp_dir)
+        _finish_storybook(row, result)
+        with client:
+            refresh_table()
+            render_downloads()
+            ui.notify('Postproducción completada, revisa el PDF')
+        dialog.close()
 
+    # Closing the dialog early abandons the upload; an in-flight job cleans up itself.
+    dialog.on('hide', lambda: None if processing else STORAGE.release_temp_dir(temp_dir))
     with dialog, ui.card().classes('p-4'):
         ui.label('Sube el Storybook en PDF')
         ui.upload(on_upload=_on_upload, auto_upload=True, multiple=True).props('accept=.pdf')
@@ -449,7 +1035,10 @@ def mark_done(row: dict) -> None:
     refresh_table()
 @ui.page('/')
 def main_page() -> None:
-    global table, download_container
+    global download_container
+    client = context.client
+    client.storage['search'] = ''
+
     columns = [
         {'name': 'order', 'label': 'Pedido', 'field': 'order'},
         {'name': 'client', 'label': 'Cliente', 'field': 'client'},
@@ -464,10 +1053,16 @@ def main_page() -> None:
     with ui.header().classes('items-center justify-between'):
         with ui.row():
             ui.button('EXPORTAR CSV', on_click=lambda: ui.download('/api/export.csv'))
-            ui.button('REFRESCAR', on_click=refresh_table)
-            ui.button('Cargar pedidos de prueba', on_click=lambda e: asyncio.create_task(load_sample_orders(e.client)))
+            ui.button('EXPORTAR PROMPTS', on_click=lambda: ui.download(
+                f"/api/prompts.jsonl?q={quote(client.storage.get('search', ''))}"))
+            ui.button('REFRESCAR', on_click=lambda: refresh_table(client))
+            ui.button('Cargar pedidos de prueba', on_click=lambda e: background_tasks.create(load_sample_orders(e.client)))
+        ui.input(placeholder='Buscar pedido, cliente, email, historia, tag…',
+                 on_change=lambda e: set_search(client, e.value)).props('dense dark clearable debounce=250').classes('w-96')
 
-    table = ui.table(columns=columns, rows=ORDERS, row_key='id')
+    table = ui.table(columns=columns, rows=[], row_key='id')
+    client.storage['table'] = table
+    refresh_table(client)
 
     status_slot = """
     <q-td :props="props">
@@ -492,11 +1087,11 @@ def main_page() -> None:
 
     def _row_from_event(e):
         rid = e.args if isinstance(e.args, str) else e.args[0]
-        return next(r for r in ORDERS if r['id'] == rid)
+        return ORDERS_BY_ID[rid]
 
-    table.on('open_notebooklm', lambda e: asyncio.create_task(open_notebooklm(_row_from_event(e), e.client)))
-    table.on('open_storybook', lambda e: asyncio.create_task(open_storybook(_row_from_event(e), e.client)))
-    table.on('upload_storybook', lambda e: asyncio.create_task(upload_storybook(_row_from_event(e), e.client)))
+    table.on('open_notebooklm', lambda e: background_tasks.create(open_notebooklm(_row_from_event(e), e.client)))
+    table.on('open_storybook', lambda e: background_tasks.create(open_storybook(_row_from_event(e), e.client)))
+    table.on('upload_storybook', lambda e: background_tasks.create(upload_storybook(_row_from_event(e), e.client)))
     table.on('mark_done', lambda e: mark_done(_row_from_event(e)))
     import_block()
     download_container = ui.column()
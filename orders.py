@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import atexit
+import sqlite3
+import sys
+import threading
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+# Columns shown in the order tables; the only fields sent to the browser.
+TABLE_FIELDS = ('id', 'order', 'client', 'email', 'cover', 'personalized_characters',
+                'narration', 'revisions', 'status')
+# Long free text kept out of memory and loaded on access.
+LAZY_TEXT = ('story', 'notebook_text', 'voice_text')
+
+_STRINGS = ('id', 'created', 'order', 'client', 'email', 'cover', 'narration',
+            'voice_name', 'voice_seed', 'voice_sample', 'status')
+_INTS = ('personalized_characters', 'revisions', 'pages')
+_LISTS = ('character_names', 'photos')
+# Parsed product options, shared by every order with the same Shopify tags.
+_SHARED = ('variant',)
+# Low-cardinality values shared by thousands of orders are interned.
+_INTERNED = frozenset({'created', 'cover', 'narration', 'status'})
+_FIXED = frozenset(_STRINGS + _INTS + _LISTS + _SHARED + ('tags',))
+
+
+class TagVocabulary:
+    """Assigns each distinct tag a bit so an order's tags fit in one int."""
+
+    def __init__(self) -> None:
+        self._bits: dict[str, int] = {}
+        self._names: list[str] = []
+        self._lock = threading.Lock()
+
+    def bit(self, name: str) -> int:
+        b = self._bits.get(name)
+        if b is None:
+            with self._lock:
+                b = self._bits.setdefault(name, len(self._names))
+                if b == len(self._names):
+                    self._names.append(sys.intern(name))
+        return b
+
+    def encode(self, names: Iterable[str]) -> int:
+        mask = 0
+        for n in names:
+            mask |= 1 << self.bit(n)
+        return mask
+
+    def decode(self, mask: int) -> list[str]:
+        return [self._names[i] for i in range(mask.bit_length()) if mask >> i & 1]
+
+    def mask(self, name: str) -> int:
+        b = self._bits.get(name)
+        return 0 if b is None else 1 << b
+
+
+TAGS = TagVocabulary()
+
+
+def is_premium(cover: str) -> bool:
+    return cover.lower() == 'premium hardcover'
+
+
+def pages_for_cover(cover: str) -> int:
+    return 24 if is_premium(cover) else 32
+
+
+def books_for_cover(cover: str) -> int:
+    """Storybook PDFs per order: premium books come in two parts."""
+    return 2 if is_premium(cover) else 1
+
+
+class TextStore:
+    """SQLite side store for the long text fields of in-memory orders.
+
+    It only offloads memory for the running process (``ORDERS`` itself is
+    not persisted), so durability is traded for speed and the file is
+    removed at exit.
+    """
+
+    def __init__(self, path: Path | str = ':memory:') -> None:
+        self.path = path
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            Path(path).unlink(missing_ok=True)
+            atexit.register(self.close)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        # Rowid table: bodies are too large for a compact WITHOUT ROWID b-tree.
+        self._db.execute('CREATE TABLE IF NOT EXISTS texts (id TEXT, field TEXT, body TEXT, '
+                         'PRIMARY KEY (id, field))')
+        self._lock = threading.Lock()
+
+    def get(self, rid: str, field: str) -> str | None:
+        with self._lock:
+            row = self._db.execute('SELECT body FROM texts WHERE id = ? AND field = ?',
+                                   (rid, field)).fetchone()
+        return row[0] if row else None
+
+    def put(self, rid: str, field: str, body: str) -> None:
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO texts VALUES (?, ?, ?)', (rid, field, body))
+
+    def delete(self, rid: str, field: str) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM texts WHERE id = ? AND field = ?', (rid, field))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+        if self.path != ':memory:':
+            Path(self.path).unlink(missing_ok=True)
+
+
+class OrderRecord(MutableMapping):
+    """Compact order with the same key/value interface as the old order dicts.
+
+    Fixed fields live in ``__slots__``; ``cover``, ``status``, ``narration``
+    and ``created`` are interned, tags are a bitset over ``TAGS``, lists are
+    tuples, ``variant`` is shared with other orders and must not be mutated, the ``LAZY_TEXT`` fields sit in ``OrderRecord.texts`` and any
+    other key goes to a small overflow dict.
+    """
+
+    __slots__ = _STRINGS + _INTS + _LISTS + _SHARED + ('_tags', '_lazy', '_extra')
+    texts: TextStore = TextStore()
+    # Called with the record after every status change (e.g. search index),
+    # but not for the initial status a record is built with.
+    status_listeners: list[Callable[[OrderRecord], None]] = []
+
+    def __init__(self, data: dict | None = None, **kwargs: Any) -> None:
+        for name in _STRINGS:
+            object.__setattr__(self, name, '')
+        for name in _INTS:
+            object.__setattr__(self, name, 0)
+        for name in _LISTS:
+            object.__setattr__(self, name, ())
+        for name in _SHARED:
+            object.__setattr__(self, name, None)
+        self._tags = 0
+        self._lazy = 0
+        self._extra: dict[str, Any] | None = None
+        data = {**(data or {}), **kwargs}
+        # Lazy text is keyed by id, so the id has to be set first.
+        self._store('id', data.pop('id', ''))
+        for key, value in data.items():
+            self._store(key, value)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> OrderRecord:
+        return data if isinstance(data, cls) else cls(data)
+
+    # -- mapping protocol --------------------------------------------------
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'tags':
+            return TAGS.decode(self._tags)
+        if key in _FIXED:
+            value = getattr(self, key)
+            return list(value) if key in _LISTS else value
+        if key in LAZY_TEXT:
+            if not self._lazy >> LAZY_TEXT.index(key) & 1:
+                raise KeyError(key)
+            return self.texts.get(self.id, key) or ''
+        if self._extra is None or key not in self._extra:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._store(key, value)
+        if key == 'status':
+            for listener in self.status_listeners:
+                listener(self)
+
+    def _store(self, key: str, value: Any) -> None:
+        if key == 'tags':
+            self._tags = TAGS.encode(value or ())
+        elif key in _LISTS:
+            object.__setattr__(self, key, tuple(value or ()))
+        elif key in _INTS:
+            object.__setattr__(self, key, int(value or 0))
+        elif key in _SHARED:
+            object.__setattr__(self, key, value)
+        elif key in _STRINGS:
+            value = '' if value is None else str(value)
+            object.__setattr__(self, key, sys.intern(value) if key in _INTERNED else value)
+        elif key in LAZY_TEXT:
+            self._lazy |= 1 << LAZY_TEXT.index(key)
+            self.texts.put(self.id, key, '' if value is None else str(value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in LAZY_TEXT and self._lazy >> LAZY_TEXT.index(key) & 1:
+            self._lazy &= ~(1 << LAZY_TEXT.index(key))
+            self.texts.delete(self.id, key)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _STRINGS
+        yield from _INTS
+        yield from _LISTS
+        yield from _SHARED
+        yield 'tags'
+        for i, name in enumerate(LAZY_TEXT):
+            if self._lazy >> i & 1:
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return len(_FIXED) + bin(self._lazy).count('1') + len(self._extra or ())
+
+    def __repr__(self) -> str:
+        return f'OrderRecord(order={self.order!r}, id={self.id!r}, status={self.status!r})'
+
+    # -- helpers -----------------------------------------------------------
+
+    def has_tag(self, name: str) -> bool:
+        """Bit test, cheaper than ``name in row['tags']``."""
+        return bool(self._tags & TAGS.mask(name))
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self.items())
+
+    def to_row(self) -> dict[str, Any]:
+        """Only the table columns, for UIs that display many orders."""
+        return {name: getattr(self, name) for name in TABLE_FIELDS}
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 6x9" at 300 dpi on the long edge is enough for a full-page print.
+PRINT_MAX_PX = 2700
+THUMB_PX = 256
+CHUNK_SIZE = 64 * 1024
+# Photo URLs come from imported CSVs, so local paths and other schemes are
+# never opened: they would copy server files into public bundles.
+ALLOWED_SCHEMES = ('http', 'https')
+
+
+class PhotoCache:
+    """Content-addressed cache of customer photos with print/thumbnail variants.
+
+    Originals are stored as ``<root>/<sha[:2]>/<sha>`` and variants next to
+    them as ``<sha>.print.jpg`` / ``<sha>.thumb.jpg``; ``urls.json`` remembers
+    which URL produced which hash so repeated orders are not downloaded again.
+    """
+
+    def __init__(self, root: Path, max_connections: int = 8, timeout: float = 30,
+                 session: requests.Session | None = None) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections,
+                                                    pool_maxsize=max_connections)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self._index_path = root / 'urls.json'
+        self._lock = threading.Lock()
+        try:
+            self._urls: dict[str, str] = json.loads(self._index_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self._urls = {}
+
+    def _blob(self, sha: str) -> Path:
+        return self.root / sha[:2] / sha
+
+    def _asset(self, url: str, sha: str) -> dict[str, Any]:
+        blob = self._blob(sha)
+        return {
+            'url': url,
+            'sha256': sha,
+            'original': str(blob),
+            'print': str(blob.with_name(sha + '.print.jpg')),
+            'thumb': str(blob.with_name(sha + '.thumb.jpg')),
+        }
+
+    def _download(self, url: str) -> str:
+        fd, name = tempfile.mkstemp(dir=self.root, suffix='.part')
+        tmp = Path(name)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with self.session.get(url, stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+            sha = digest.hexdigest()
+            blob = self._blob(sha)
+            if not blob.exists():
+                blob.parent.mkdir(exist_ok=True)
+                os.replace(tmp, blob)
+            return sha
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _make_variants(self, asset: dict[str, Any]) -> None:
+        print_path, thumb_path = Path(asset['print']), Path(asset['thumb'])
+        if print_path.exists() and thumb_path.exists():
+            return
+        with Image.open(asset['original']) as im:
+            im = ImageOps.exif_transpose(im).convert('RGB')
+            for path, size, quality in ((print_path, PRINT_MAX_PX, 92), (thumb_path, THUMB_PX, 80)):
+                if path.exists():
+                    continue
+                variant = im.copy()
+                variant.thumbnail((size, size), Image.LANCZOS)
+                # Same content may arrive from two URLs at once: write then rename.
+                tmp = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+                variant.save(tmp, 'JPEG', quality=quality, dpi=(300, 300))
+                os.replace(tmp, path)
+
+    def fetch(self, url: str) -> dict[str, Any] | None:
+        """Return the cached asset for ``url``, downloading it if needed."""
+        if urlsplit(url).scheme.lower() not in ALLOWED_SCHEMES:
+            logger.warning('photo URL rejected, only http(s) is accepted: %s', url)
+            return None
+        try:
+            sha = self._urls.get(url)
+            if not sha or not self._blob(sha).exists():
+                sha = self._download(url)
+                with self._lock:
+                    self._urls[url] = sha
+            asset = self._asset(url, sha)
+            self._make_variants(asset)
+            return asset
+        except Exception as e:
+            logger.warning('photo fetch failed for %s: %s', url, e)
+            return None
+
+    def fetch_many(self, urls: Iterable[str]) -> dict[str, dict[str, Any] | None]:
+        """Fetch distinct ``urls`` concurrently over at most ``max_connections``."""
+        unique = list(dict.fromkeys(u for u in urls if u))
+        if not unique:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_connections, len(unique))) as pool:
+            results = dict(zip(unique, pool.map(self.fetch, unique)))
+        self._save_index()
+        return results
+
+    def _save_index(self) -> None:
+        with self._lock:
+            tmp = self._index_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self._urls, indent=0), encoding='utf-8')
+            os.replace(tmp, self._index_path)
+
+
+def attach_photos(rows: list[dict], cache: PhotoCache) -> None:
+    """Fetch the photos of a batch of orders and set ``row['photo_assets']``."""
+    assets = cache.fetch_many(p for r in rows for p in r.get('photos') or [])
+    for r in rows:
+        r['photo_assets'] = [assets[p] for p in r.get('photos') or [] if assets.get(p)]
+
+
+def copy_photos(row: dict, photos_dir: Path) -> list[str]:
+    """Place the print variants of an order's photos in its work dir."""
+    names: list[str] = []
+    for i, asset in enumerate(row.get('photo_assets') or [], start=1):
+        src = Path(asset['print'])
+        if not src.exists():
+            continue
+        photos_dir.mkdir(parents=True, exist_ok=True)
+        name = f'foto_{i}.jpg'
+        dst = photos_dir / name
+        dst.unlink(missing_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+        names.append(name)
+    return names
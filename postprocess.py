@@ -1,26 +1,33 @@
 from __future__ import annotations
 
+import threading
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import pypdfium2 as pdfium
 from PIL import Image
 
+from pdf_encoder import check_cancel, encode_pdf
+
 
 def _remove_watermark(img: Image.Image) -> Image.Image:
-    """Lighten near-white areas to reduce watermarks."""
+    """Lighten near-white areas to reduce watermarks (returns 8-bit grayscale)."""
     gray = img.convert('L')
-    cleaned = gray.point(lambda x: 255 if x > 200 else x)
-    return cleaned.convert('RGB')
+    return gray.point(lambda x: 255 if x > 200 else x)
 
 
-def postprocess_storybooks(pdf_paths: List[Path], output_path: Path, logo_path: Path) -> Path:
-    """Merge PDFs, desaturate interior pages, remove watermarks and add logo."""
+def render_storybook_pages(pdf_paths: List[Path], logo_path: Path,
+                           cancel: Optional[threading.Event] = None) -> List[Image.Image]:
+    """Render the merged pages: colour cover with logo, grayscale interior.
+
+    ``cancel`` is checked before each page (see ``pdf_encoder.Cancelled``).
+    """
     images: List[Image.Image] = []
     first_page = True
     for path in pdf_paths:
         pdf = pdfium.PdfDocument(str(path))
         for page_index, page in enumerate(pdf):
+            check_cancel(cancel)
             pil = page.render(scale=1).to_pil()
             if first_page and page_index == 0:
                 # cover: keep colors and add logo
@@ -31,11 +38,20 @@ def postprocess_storybooks(pdf_paths: List[Path], output_path: Path, logo_path:
                     factor = min(pw * 0.3 / lw, ph * 0.3 / lh)
                     logo = logo.resize((int(lw * factor), int(lh * factor)))
                     pil.paste(logo, (10, 10), logo)
+                pil = pil.convert('RGB')
             else:
+                # interior pages stay grayscale so the encoder can store them as 8/1-bit
                 pil = _remove_watermark(pil)
-            images.append(pil.convert('RGB'))
+            images.append(pil)
             first_page = False
+    return images
+
+
+def postprocess_storybooks(pdf_paths: List[Path], output_path: Path, logo_path: Path,
+                           cancel: Optional[threading.Event] = None) -> Path:
+    """Merge PDFs, desaturate interior pages, remove watermarks and add logo."""
+    images = render_storybook_pages(pdf_paths, logo_path, cancel)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     if images:
-        images[0].save(output_path, save_all=True, append_images=images[1:], format='PDF')
+        encode_pdf(images, output_path, cancel=cancel)
     return output_path
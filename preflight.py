@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import pikepdf
+
+POINTS_PER_INCH = 72.0
+# Trim sizes are compared with this slack, in points (~0.7 mm).
+SIZE_TOLERANCE_PT = 2.0
+# Allowed difference between a PDF's page count and the expected one.
+PAGE_TOLERANCE = int(os.getenv('PREFLIGHT_PAGE_TOLERANCE', '0'))
+
+
+def load_settings(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_page_size(value: str) -> tuple[float, float]:
+    """``'6x9'`` (inches) -> ``(432.0, 648.0)`` points."""
+    m = re.fullmatch(r'\s*([\d.]+)\s*[x×]\s*([\d.]+)\s*(?:in)?\s*', value or '')
+    if not m:
+        raise ValueError(f'page_size no válido: {value!r}')
+    return float(m.group(1)) * POINTS_PER_INCH, float(m.group(2)) * POINTS_PER_INCH
+
+
+def _inches(w: float, h: float) -> str:
+    return f'{w / POINTS_PER_INCH:.3g}x{h / POINTS_PER_INCH:.3g} in'
+
+
+def _page_size(page: pikepdf.Page) -> tuple[float, float]:
+    x0, y0, x1, y1 = (float(v) for v in page.trimbox)
+    w, h = abs(x1 - x0), abs(y1 - y0)
+    if int(page.obj.get('/Rotate', 0)) % 180:
+        w, h = h, w
+    return w, h
+
+
+def check_storybook(path: Path, *, pages: int | None = None,
+                    page_size: tuple[float, float] | None = None, bleed: float = 0.0) -> list[str]:
+    """Validate one storybook PDF from its structure alone, without rendering.
+
+    Checks that the file opens, is not encrypted, has ``pages`` pages (give or
+    take ``PAGE_TOLERANCE``) and that every page's trim box is ``page_size``
+    points, with or without ``bleed`` points on each side. Returns the
+    reasons it fails, empty when it passes.
+    """
+    name = Path(path).name
+    try:
+        pdf = pikepdf.open(path)
+    except pikepdf.PasswordError:
+        return [f'{name}: el PDF está protegido con contraseña']
+    except (pikepdf.PdfError, OSError) as e:
+        reason = str(e).split(': ', 1)[-1]  # drop qpdf's "<path>: " prefix
+        return [f'{name}: no es un PDF válido o está dañado ({reason})']
+    errors: list[str] = []
+    with pdf:
+        count = len(pdf.pages)
+        if count == 0:
+            return [f'{name}: el PDF no tiene páginas']
+        if pages and abs(count - pages) > PAGE_TOLERANCE:
+            errors.append(f'{name}: tiene {count} páginas, se esperaban {pages}')
+        if page_size:
+            w, h = page_size
+            allowed = [(w, h), (w + 2 * bleed, h + 2 * bleed)]
+            wrong = []
+            for i, page in enumerate(pdf.pages):
+                pw, ph = _page_size(page)
+                if not any(abs(pw - aw) <= SIZE_TOLERANCE_PT and abs(ph - ah) <= SIZE_TOLERANCE_PT
+                           for aw, ah in allowed):
+                    wrong.append((i + 1, pw, ph))
+            if wrong:
+                first, pw, ph = wrong[0]
+                more = f' (y {len(wrong) - 1} más)' if len(wrong) > 1 else ''
+                errors.append(f'{name}: la página {first} mide {_inches(pw, ph)}{more}, '
+                              f'se esperaba {_inches(w, h)}')
+    return errors
+
+
+def check_storybooks(paths: Sequence[Path], *, expected_files: int | None = None,
+                     workers: int | None = None, **kwargs) -> list[str]:
+    """Run :func:`check_storybook` over several files in parallel."""
+    errors: list[str] = []
+    if expected_files is not None and len(paths) != expected_files:
+        errors.append(f'Se esperaban {expected_files} archivos y se recibieron {len(paths)}')
+    if not paths:
+        return errors
+    workers = workers or min(len(paths), 2 * (os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(lambda p: check_storybook(p, **kwargs), paths):
+            errors.extend(result)
+    return errors
+
+
+def format_errors(errors: Iterable[str]) -> str:
+    return '\n'.join(f'• {e}' for e in errors)
@@ -0,0 +1,199 @@
+"""Batch prompt builder for NotebookLM and LLM story generation.
+
+Prompts come from templates compiled once per (kind, cover, page count,
+variant) and can be cached by the MD5 of the order fields they use, so
+unchanged orders are never rebuilt. The cache keeps prompt files on disk,
+named like the prompt files in ``data/tmp``, and only the most recent ones
+in memory. Whole batches can be exported as JSONL for a batch generation job:
+
+    python prompts.py pedidos.csv prompts.jsonl --kind story --variant "más poético"
+    python prompts.py pedidos.csv batch.jsonl --format openai --model gpt-4o-mini
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import string
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Mapping
+
+from orders import is_premium, pages_for_cover
+
+# Bump when a template changes so cached prompts are rebuilt.
+TEMPLATE_VERSION = 1
+DEFAULT_VARIANT = 'estándar'
+# Storybook pages that are not story: cover, title page and back cover.
+NON_STORY_PAGES = 3
+
+NOTEBOOKLM_TEMPLATE = 'Genera una historia a partir de la siguiente información:\n$parts$story$characters'
+STORY_TEMPLATE = (
+    'Eres un autor de cuentos personalizados. Crea un cuento en $story_pages páginas '
+    '(JSON: lista de objetos {heading, body}).\n'
+    'Título: $title\n'
+    'Especificaciones del cliente: $specs. Variante: $variant\n'
+    'Tono: emocional, positivo, para todas las edades.\n'
+    'Instrucciones:\n'
+    '- Sin prefacios ni epílogos; solo la lista JSON.\n'
+    '- Cada página: 1 título (heading) + 1-4 frases (body).\n'
+    '- Vocabulario claro; evita tecnicismos.\n'
+    '- Mantén continuidad.$parts_rule\n'
+    '- Español neutro.'
+)
+KINDS = ('notebooklm', 'story')
+
+
+@lru_cache(maxsize=256)
+def compile_template(kind: str, cover: str, pages: int, variant: str) -> string.Template:
+    """Template with everything that depends only on the key already filled in."""
+    if kind == 'notebooklm':
+        parts = 'La historia debe dividirse en dos partes.\n' if is_premium(cover) else ''
+        return string.Template(NOTEBOOKLM_TEMPLATE.replace('$parts', parts.replace('$', '$$')))
+    if kind == 'story':
+        fixed = {
+            'story_pages': str(max(pages - NON_STORY_PAGES, 1)),
+            'variant': variant,
+            'parts_rule': '\n- Divide el cuento en dos partes de igual extensión.' if is_premium(cover) else '',
+        }
+        return string.Template(string.Template(STORY_TEMPLATE).safe_substitute(
+            {k: v.replace('$', '$$') for k, v in fixed.items()}))
+    raise ValueError(f'tipo de prompt desconocido: {kind!r}')
+
+
+def _character_lines(row: Mapping[str, Any]) -> list[str]:
+    names = row.get('character_names') or []
+    if not (row.get('photos') and names):
+        return []
+    assets = row.get('photo_assets') or []
+    return [f"El personaje {name} tiene que ser el de la foto adjunta{f' foto_{i + 1}.jpg' if i < len(assets) else ''}."
+            for i, name in enumerate(names)]
+
+
+def prompt_inputs(row: Mapping[str, Any], kind: str, variant: str = DEFAULT_VARIANT) -> dict[str, Any]:
+    """The order fields a prompt depends on; they are also its cache key."""
+    cover = row.get('cover') or ''
+    return {
+        'v': TEMPLATE_VERSION, 'kind': kind, 'cover': cover,
+        'pages': int(row.get('pages') or pages_for_cover(cover)),
+        'variant': row.get('prompt_variant') or variant,
+        'story': (row.get('story') or '').strip(), 'characters': tuple(_character_lines(row)),
+        'title': (row.get('title') or f"Historia {row.get('order', '')}") if kind == 'story' else '',
+    }
+
+
+def render(inputs: Mapping[str, Any]) -> str:
+    template = compile_template(inputs['kind'], inputs['cover'], inputs['pages'], inputs['variant'])
+    if inputs['kind'] == 'notebooklm':
+        story = inputs['story'] + '\n' if inputs['story'] else ''
+        characters = '\n'.join(inputs['characters'])
+        return template.substitute(story=story, characters=characters).strip()
+    specs = ' '.join([inputs['story'], *inputs['characters']]).strip() or 'sin especificaciones'
+    return template.substitute(title=inputs['title'], specs=specs)
+
+
+def input_hash(inputs: Mapping[str, Any]) -> str:
+    data = json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.md5(data, usedforsecurity=False).hexdigest()
+
+
+class PromptCache:
+    """Prompts by the MD5 of their inputs, as ``<root>/<hash>`` files.
+
+    Only the last ``max_items`` prompts stay in memory, so the cache does not
+    grow with the number of orders; without ``root`` it is memory only.
+    """
+
+    def __init__(self, root: Path | None = None, max_items: int = 1024) -> None:
+        self.root = root
+        if root is not None:
+            root.mkdir(parents=True, exist_ok=True)
+        self.max_items = max_items
+        self._items: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, inputs: Mapping[str, Any]) -> str | None:
+        key = input_hash(inputs)
+        prompt = self._items.get(key)
+        if prompt is None and self.root is not None:
+            try:
+                prompt = (self.root / key).read_text(encoding='utf-8')
+            except OSError:
+                prompt = None
+            if prompt is not None:
+                self._remember(key, prompt)
+        if prompt is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return prompt
+
+    def put(self, inputs: Mapping[str, Any], prompt: str) -> None:
+        key = input_hash(inputs)
+        self._remember(key, prompt)
+        if self.root is not None:
+            tmp = self.root / f'{key}.{threading.get_ident()}.tmp'
+            tmp.write_text(prompt, encoding='utf-8')
+            os.replace(tmp, self.root / key)
+
+    def _remember(self, key: str, prompt: str) -> None:
+        with self._lock:
+            if len(self._items) >= self.max_items:
+                self._items.pop(next(iter(self._items)))
+            self._items[key] = prompt
+
+
+def build_prompts(rows: Iterable[Mapping[str, Any]], kind: str = 'notebooklm',
+                  variant: str = DEFAULT_VARIANT, cache: PromptCache | None = None) -> Iterator[dict[str, Any]]:
+    """Yield ``{order, id, kind, prompt}`` for each row, reusing cached prompts."""
+    if kind not in KINDS:
+        raise ValueError(f'tipo de prompt desconocido: {kind!r}')
+    for row in rows:
+        inputs = prompt_inputs(row, kind, variant)
+        prompt = cache.get(inputs) if cache is not None else None
+        if prompt is None:
+            prompt = render(inputs)
+            if cache is not None:
+                cache.put(inputs, prompt)
+        yield {'order': row.get('order', ''), 'id': row.get('id', ''), 'kind': kind, 'prompt': prompt}
+
+
+def jsonl_lines(prompts: Iterable[dict[str, Any]], fmt: str = 'plain', model: str = 'gpt-4o-mini') -> Iterator[str]:
+    """Serialise prompts for a batch job: ``plain`` records or OpenAI Batch API requests."""
+    for p in prompts:
+        custom_id = f"{p['order']}-{p['id']}-{p['kind']}"
+        if fmt == 'openai':
+            record = {'custom_id': custom_id, 'method': 'POST', 'url': '/v1/chat/completions',
+                      'body': {'model': model, 'messages': [{'role': 'user', 'content': p['prompt']}]}}
+        else:
+            record = {'custom_id': custom_id, **p}
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Exporta prompts de pedidos a JSONL')
+    parser.add_argument('orders', type=Path, help='CSV/Excel de pedidos')
+    parser.add_argument('output', type=Path)
+    parser.add_argument('--kind', choices=KINDS, default='story')
+    parser.add_argument('--variant', default=DEFAULT_VARIANT)
+    parser.add_argument('--format', choices=('plain', 'openai'), default='plain')
+    parser.add_argument('--model', default='gpt-4o-mini')
+    parser.add_argument('--cache', type=Path, default=Path(__file__).parent / 'cache' / 'prompts')
+    args = parser.parse_args()
+
+    from main import parse_orders
+    rows = parse_orders(args.orders)
+    cache = PromptCache(args.cache)
+    t0 = time.perf_counter()
+    with open(args.output, 'w', encoding='utf-8') as out:
+        out.writelines(jsonl_lines(build_prompts(rows, args.kind, args.variant, cache), args.format, args.model))
+    print(f'{len(rows)} prompts en {time.perf_counter() - t0:.2f} s '
+          f'({cache.misses} generados, {cache.hits} desde caché) -> {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from typing import Iterable, Mapping
+
+# Indexed columns; ``campo:valor`` in a query restricts a term to one of them.
+FIELDS = ('order', 'client', 'email', 'story', 'tags', 'variant', 'character_names', 'status')
+_TERM = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+_WORD = re.compile(r'\w+')
+
+
+def _text(value: object) -> str:
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(t for t in map(_text, value) if t)
+    return '' if value is None else str(value)
+
+
+def _phrase(word: str, prefix: bool) -> str:
+    # one-letter prefixes match nearly every order and are not in the prefix index
+    return f'"{word}"*' if prefix and len(word) >= 2 else f'"{word}"'
+
+
+def build_query(text: str) -> str:
+    """Turn operator input into an FTS5 query.
+
+    All words must match. Words are matched whole except the last one, which
+    is a prefix while the operator is still typing it, so ``ana gma`` finds
+    ana.lopez@gmail.com. ``campo:valor`` limits a term to one of
+    ``FIELDS`` (e.g. ``status:done``, ``tags:voice``, ``variant:corazones``).
+    """
+    terms: list[tuple[str, list[str]]] = []
+    for field, term in _TERM.findall(text):
+        if field and field.lower() in FIELDS:
+            terms.append((field.lower(), _WORD.findall(term)))
+        else:
+            terms.append(('', _WORD.findall(f'{field} {term}' if field else term)))
+    terms = [(f, words) for f, words in terms if words]
+    parts: list[str] = []
+    for i, (field, words) in enumerate(terms):
+        last = i == len(terms) - 1
+        phrases = [_phrase(w, last and j == len(words) - 1) for j, w in enumerate(words)]
+        if field:
+            parts.append(f'"{field}" : (' + ' '.join(phrases) + ')')
+        else:
+            parts.extend(phrases)
+    return ' AND '.join(parts)
+
+
+class OrderIndex:
+    """Incremental SQLite FTS5 index over the in-memory orders.
+
+    Rows are keyed by an integer rowid assigned per order id, so a status
+    change rewrites a single index row instead of scanning for the id.
+    """
+
+    def __init__(self) -> None:
+        # rebuilt from the orders on every import, so it never needs a file
+        self._db = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=OFF')
+        cols = ', '.join(f'"{f}"' for f in FIELDS)
+        self._db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5({cols}, "
+                         "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')")
+        self._insert = f'INSERT INTO orders_fts (rowid, {cols}) VALUES (?{", ?" * len(FIELDS)})'
+        self._rowids: dict[str, int] = {}
+        self._ids: dict[int, str] = {}
+        self._next = 1
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rowids)
+
+    def _values(self, row: Mapping) -> list[str]:
+        return [_text(row.get(f)) for f in FIELDS]
+
+    def add(self, rows: Iterable[Mapping]) -> None:
+        """Index new orders, or re-index ones already present."""
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                for row in rows:
+                    rowid = self._rowids.get(row['id'])
+                    if rowid is None:
+                        rowid, self._next = self._next, self._next + 1
+                        self._rowids[row['id']] = rowid
+                        self._ids[rowid] = row['id']
+                    else:
+                        self._db.execute('DELETE FROM orders_fts WHERE rowid = ?', (rowid,))
+                    self._db.execute(self._insert, (rowid, *self._values(row)))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def update_status(self, row: Mapping) -> None:
+        rowid = self._rowids.get(row.get('id'))
+        if rowid is None:
+            return
+        with self._lock:
+            self._db.execute('UPDATE orders_fts SET status = ? WHERE rowid = ?',
+                             (_text(row.get('status')), rowid))
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for rid in ids:
+                rowid = self._rowids.pop(rid, None)
+                if rowid is not None:
+                    del self._ids[rowid]
+                    self._db.execute('DELETE FROM orders_fts WHERE rowid = ?', (rowid,))
+
+    def search(self, text: str, limit: int = 100) -> list[str]:
+        """Order ids matching ``text``, newest first."""
+        query = build_query(text)
+        if not query:
+            return []
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    'SELECT rowid FROM orders_fts WHERE orders_fts MATCH ? ORDER BY rowid DESC LIMIT ?',
+                    (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        return [self._ids[r[0]] for r in rows if r[0] in self._ids]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+
+if TYPE_CHECKING:
+    from blobs import BlobStore
+
+logger = logging.getLogger(__name__)
+
+# What survives purging a DONE order's work dir besides its ZIP: the audio the
+# printed QR codes point to and the manifest the delivery index is built from.
+KEEP_AFTER_DONE = ('audio', 'manifest.json')
+# Orders in these states are never evicted by age or quota; neither are work
+# dirs whose status is unknown.
+ACTIVE_STATUSES = {
+    'Pending to NotebookLM', 'Pending to Storybook', 'Pending storybook upload',
+    'Processing storybook', 'Pending yo revise PDF',
+}
+MANIFEST = 'manifest.json'
+
+
+def _tree_size(path: Path) -> tuple[int, int, float]:
+    """Return ``(bytes, files, newest mtime)`` for a file or directory tree.
+
+    Hardlinked files (blob store artifacts) are charged ``size / links`` so
+    shared content is not counted once per order.
+    """
+    if path.is_file():
+        st = path.stat()
+        return st.st_size // st.st_nlink, 1, st.st_mtime
+    total = files = 0
+    newest = 0.0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                total += st.st_size // st.st_nlink
+                files += 1
+                newest = max(newest, st.st_mtime)
+    return total, files, newest
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def split_work_dir(name: str) -> tuple[str, str]:
+    """``order_<order>_<id>`` -> ``(order, id)``; ids are UUIDs without ``_``."""
+    order, _, rid = name.removeprefix('order_').rpartition('_')
+    return order, rid
+
+
+def read_status(work_dir: Path) -> str | None:
+    """Status recorded in a work dir's manifest, ``None`` when unknown."""
+    try:
+        manifest = json.loads((work_dir / MANIFEST).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return (manifest.get('status') or None) if isinstance(manifest, dict) else None
+
+
+def write_status(work_dir: Path, status: str) -> bool:
+    """Record ``status`` in the work dir's manifest so it survives restarts.
+
+    Returns ``False`` when the work dir has no manifest (not bundled yet).
+    """
+    path = work_dir / MANIFEST
+    try:
+        manifest = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return False
+    if manifest.get('status') == status:
+        return True
+    manifest['status'] = status
+    tmp = path.with_name(f'.{MANIFEST}.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp, path)
+    return True
+
+
+class StorageManager:
+    """Per-work-dir disk accounting and eviction for ``downloads/`` and temp dirs.
+
+    Policies, applied by :meth:`sweep` (and periodically by :meth:`start`):
+
+    * temp dirs older than ``tmp_max_age`` seconds are removed;
+    * DONE orders keep only their ZIP plus ``KEEP_AFTER_DONE``;
+    * work dirs older than ``max_age`` seconds that are not in progress are removed;
+    * while usage exceeds ``quota_bytes`` the oldest finished work dirs are removed;
+    * blobs no order links to any more are collected from ``blobs``.
+
+    Policies act per work dir (``order_<order>_<id>``), so records that share
+    an order number never take each other's files with them. The status comes
+    from ``statuses`` (the in-memory orders) and otherwise from the work dir's
+    manifest, where :meth:`record_status` keeps it, so it survives restarts;
+    a work dir whose status is unknown is never evicted.
+    """
+
+    def __init__(self, root: Path, tmp_root: Path, *, quota_bytes: int | None = None,
+                 max_age: float | None = None, tmp_max_age: float = 24 * 3600,
+                 statuses: Callable[[], dict[str, str]] | None = None,
+                 on_evict: Callable[[Path], None] | None = None,
+                 blobs: BlobStore | None = None) -> None:
+        self.root = root
+        self.tmp_root = tmp_root
+        self.tmp_root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.tmp_max_age = tmp_max_age
+        self.statuses = statuses or dict
+        self.on_evict = on_evict
+        self.blobs = blobs
+        self._active: set[Path] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # -- temp dirs ---------------------------------------------------------
+
+    def make_temp_dir(self, prefix: str = '') -> Path:
+        """Create a scratch directory; pair with :meth:`release_temp_dir`."""
+        path = Path(tempfile.mkdtemp(prefix=prefix, dir=self.tmp_root))
+        with self._lock:
+            self._active.add(path)
+        return path
+
+    def release_temp_dir(self, path: Path, delete: bool = True) -> None:
+        """Stop tracking ``path``; with ``delete=False`` ownership passes elsewhere
+        and the sweeper removes it once it is older than ``tmp_max_age``."""
+        with self._lock:
+            self._active.discard(path)
+        if delete:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def temp_dir(self, prefix: str = '') -> Iterator[Path]:
+        """Scratch directory that is removed when the block exits."""
+        path = self.make_temp_dir(prefix)
+        try:
+            yield path
+        finally:
+            self.release_temp_dir(path)
+
+    def _sweep_temp(self, now: float) -> int:
+        freed = 0
+        with self._lock:
+            active = set(self._active)
+        for entry in self.tmp_root.iterdir():
+            if entry in active:
+                continue
+            size, _, mtime = _tree_size(entry)
+            if now - max(mtime, entry.stat().st_mtime) < self.tmp_max_age:
+                continue
+            _remove(entry)
+            freed += size
+        return freed
+
+    # -- status ------------------------------------------------------------
+
+    def work_dir(self, row: dict) -> Path:
+        return self.root / f"order_{row['order']}_{row['id']}"
+
+    def record_status(self, row: dict) -> None:
+        """Status listener: persist ``row``'s status in its work dir.
+
+        Only orders flagged ``bundled`` have a manifest, so other status
+        changes (e.g. a whole import) never touch the disk.
+        """
+        if row.get('bundled') and row.get('status'):
+            write_status(self.work_dir(row), row['status'])
+
+    def _status(self, path: Path, statuses: dict[str, str]) -> str | None:
+        return statuses.get(split_work_dir(path.name)[1]) or read_status(path)
+
+    # -- accounting --------------------------------------------------------
+
+    def usage(self) -> list[dict[str, Any]]:
+        """Disk usage per work dir and per order ZIP, newest first."""
+        statuses = self.statuses()
+        entries: list[dict[str, Any]] = []
+        for path in self.root.glob('order_*'):
+            if path.is_dir():
+                order, _ = split_work_dir(path.name)
+                kind, status = 'work', self._status(path, statuses)
+            elif path.suffix == '.zip':
+                order, kind, status = path.stem.removeprefix('order_'), 'zip', None
+            else:
+                continue
+            size, files, mtime = _tree_size(path)
+            entries.append({'order': order, 'kind': kind, 'name': path.name, 'status': status,
+                            'total_bytes': size, 'files': files, 'mtime': mtime})
+        return sorted(entries, key=lambda e: e['mtime'], reverse=True)
+
+    def report(self) -> dict[str, Any]:
+        orders = self.usage()
+        tmp_bytes, _, _ = _tree_size(self.tmp_root)
+        blobs = self.blobs.usage() if self.blobs else None
+        return {
+            'total_bytes': sum(e['total_bytes'] for e in orders) + tmp_bytes + (blobs['share_bytes'] if blobs else 0),
+            'tmp_bytes': tmp_bytes,
+            'blobs': blobs,
+            'quota_bytes': self.quota_bytes,
+            'orders': orders,
+        }
+
+    # -- eviction ----------------------------------------------------------
+
+    def purge_work_dir(self, work_dir: Path, keep: tuple[str, ...] = KEEP_AFTER_DONE) -> int:
+        """Delete a work dir except for ``keep`` entries, returning bytes freed."""
+        freed = 0
+        for child in work_dir.iterdir():
+            if child.name in keep:
+                continue
+            size, _, _ = _tree_size(child)
+            _remove(child)
+            freed += size
+        return freed
+
+    def remove_work_dir(self, work_dir: Path) -> int:
+        """Delete one work dir, and its order's ZIP once no work dir of the order is left."""
+        freed = _tree_size(work_dir)[0]
+        _remove(work_dir)
+        if self.on_evict:
+            self.on_evict(work_dir)
+        order, _ = split_work_dir(work_dir.name)
+        siblings = [p for p in self.root.glob(f'order_{order}_*')
+                    if p.is_dir() and split_work_dir(p.name)[0] == order]
+        zip_path = self.root / f'order_{order}.zip'
+        if not siblings and zip_path.exists():
+            freed += _tree_size(zip_path)[0]
+            _remove(zip_path)
+        return freed
+
+    def sweep(self) -> dict[str, int]:
+        """Apply all policies once and return what was freed."""
+        now = time.time()
+        summary = {'tmp_bytes': self._sweep_temp(now), 'purged_bytes': 0, 'evicted_bytes': 0,
+                   'evicted_orders': 0, 'blob_bytes': 0}
+        statuses = self.statuses()
+        for path in self.root.glob('order_*'):
+            order, _ = split_work_dir(path.name)
+            if (path.is_dir() and self._status(path, statuses) == 'DONE'
+                    and (self.root / f'order_{order}.zip').exists()):
+                summary['purged_bytes'] += self.purge_work_dir(path)
+        entries = self.usage()
+        evictable = [e for e in entries
+                     if e['kind'] == 'work' and e['status'] and e['status'] not in ACTIVE_STATUSES]
+        evicted: set[str] = set()
+
+        def evict(e: dict[str, Any]) -> int:
+            freed = self.remove_work_dir(self.root / e['name'])
+            evicted.add(e['name'])
+            summary['evicted_bytes'] += freed
+            summary['evicted_orders'] += 1
+            return freed
+
+        if self.max_age is not None:
+            for e in evictable:
+                if now - e['mtime'] > self.max_age:
+                    evict(e)
+        if self.quota_bytes is not None:
+            used = sum(e['total_bytes'] for e in entries if e['name'] not in evicted)
+            used += _tree_size(self.tmp_root)[0]
+            if self.blobs is not None:
+                used += self.blobs.usage()['share_bytes']
+            for e in sorted(evictable, key=lambda e: e['mtime']):
+                if used <= self.quota_bytes:
+                    break
+                if e['name'] not in evicted:
+                    used -= evict(e)
+        if self.blobs is not None:
+            # purged and evicted orders only dropped their links; free the content now
+            summary['blob_bytes'] = self.blobs.gc()
+        if any(summary.values()):
+            logger.info('storage sweep: %s', summary)
+        return summary
+
+    # -- background sweeper ------------------------------------------------
+
+    def start(self, interval: float) -> None:
+        """Run :meth:`sweep` every ``interval`` seconds in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception('storage sweep failed')
+
+        self._thread = threading.Thread(target=loop, name='storage-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,66 @@
+"""Streaming order import (``CsvStreamParser``, ``import_orders_stream``).
+
+    python -m pytest -q test_import.py
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator
+
+import pytest
+
+import main
+from main import CsvStreamParser
+
+
+def _parse(data: bytes, chunk_size: int = 3) -> list:
+    """Feed ``data`` in small chunks so records and characters straddle them."""
+    parser = CsvStreamParser()
+    rows = []
+    for i in range(0, len(data), chunk_size):
+        rows += parser.feed(data[i:i + chunk_size])
+    return rows + parser.close()
+
+
+def test_quoted_field_with_newline() -> None:
+    rows = _parse(b'order,story\n1,"linea uno\nlinea dos"\n2,corta\n')
+    assert [r['order'] for r in rows] == ['1', '2']
+    assert rows[0]['story'] == 'linea uno\nlinea dos'
+    assert rows[1]['story'] == 'corta'
+
+
+def test_crlf_line_endings() -> None:
+    rows = _parse(b'order,client\r\n1,Ana\r\n2,"Ben\r\nB"\r\n')
+    assert [(r['order'], r['client']) for r in rows] == [('1', 'Ana'), ('2', 'Ben\r\nB')]
+
+
+def test_bom_is_stripped_from_header() -> None:
+    rows = _parse('order,client\n7,Ana\n'.encode('utf-8-sig'))
+    assert rows[0]['order'] == '7'
+
+
+def test_latin1_line() -> None:
+    data = 'order,client\n1,Núñez\n'.encode('utf-8') + '2,Peña\n'.encode('latin1')
+    rows = _parse(data)
+    assert [r['client'] for r in rows] == ['Núñez', 'Peña']
+
+
+def test_no_trailing_newline() -> None:
+    rows = _parse(b'order,client\n1,Ana\n2,Ben', chunk_size=64)
+    assert [r['client'] for r in rows] == ['Ana', 'Ben']
+
+
+def test_failed_import_leaves_no_orders() -> None:
+    lines = [b'order,client,revisions'] + [b'%d,Cliente %d,1' % (i, i) for i in range(5000)]
+    data = b'\n'.join(lines + [b'5000,Cliente 5000,abc']) + b'\n'
+
+    async def chunks() -> AsyncIterator[bytes]:
+        for i in range(0, len(data), main.IMPORT_CHUNK_SIZE // 8):
+            yield data[i:i + main.IMPORT_CHUNK_SIZE // 8]
+
+    before = len(main.ORDERS)
+    with pytest.raises(ValueError):
+        asyncio.run(main.import_orders_stream(chunks(), 'pedidos.csv'))
+    assert len(main.ORDERS) == before
+    assert len(main.ORDERS_BY_ID) == before
+    assert main.search_orders('Cliente') == []
@@ -0,0 +1,119 @@
+"""Photo ingestion (``photos.py``) against a local HTTP stand-in.
+
+    python -m pytest -q test_photos.py
+"""
+from __future__ import annotations
+
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from PIL import Image
+
+from photos import PRINT_MAX_PX, THUMB_PX, PhotoCache, attach_photos, copy_photos
+
+
+def _jpeg(color: tuple[int, int, int], size: tuple[int, int] = (3200, 2400)) -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'JPEG', quality=70)
+    return out.getvalue()
+
+
+class StandIn:
+    """Threaded HTTP server serving fixed photos and counting requests."""
+
+    def __init__(self, files: dict[str, bytes], delay: float = 0.05) -> None:
+        self.files = files
+        self.requests: list[str] = []
+        self.active = self.peak = 0
+        lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with lock:
+                    stand_in.requests.append(self.path)
+                    stand_in.active += 1
+                    stand_in.peak = max(stand_in.peak, stand_in.active)
+                try:
+                    time.sleep(delay)
+                    body = stand_in.files.get(self.path)
+                    if body is None:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with lock:
+                        stand_in.active -= 1
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_fetch_many_downloads_once_with_bounded_connections(tmp_path: Path) -> None:
+    red, blue = _jpeg((200, 30, 30)), _jpeg((30, 30, 200))
+    files = {f'/p{i}.jpg': red if i % 2 else blue for i in range(8)}
+    server = StandIn(files)
+    try:
+        cache = PhotoCache(tmp_path, max_connections=3)
+        urls = [server.url + path for path in files]
+        assets = cache.fetch_many(urls + urls[:2])
+        assert len(server.requests) == len(files)
+        assert 1 < server.peak <= 3
+        # identical content from different URLs is stored once
+        assert len({a['sha256'] for a in assets.values()}) == 2
+        for asset in assets.values():
+            with Image.open(asset['print']) as im:
+                assert max(im.size) == PRINT_MAX_PX
+            with Image.open(asset['thumb']) as im:
+                assert max(im.size) == THUMB_PX
+
+        # a new cache over the same directory answers from disk
+        again = PhotoCache(cache.root, max_connections=3).fetch_many(urls)
+        assert len(server.requests) == len(files)
+        assert {u: a['sha256'] for u, a in again.items()} == {u: assets[u]['sha256'] for u in urls}
+    finally:
+        server.close()
+
+
+def test_failed_download_is_skipped(tmp_path: Path) -> None:
+    server = StandIn({'/ok.jpg': _jpeg((10, 200, 10), (400, 300))}, delay=0)
+    try:
+        cache = PhotoCache(tmp_path / 'cache')
+        rows = [{'photos': [server.url + '/ok.jpg', server.url + '/missing.jpg']}]
+        attach_photos(rows, cache)
+        assert [a['url'] for a in rows[0]['photo_assets']] == [server.url + '/ok.jpg']
+        work = tmp_path / 'work' / 'photos'
+        assert copy_photos(rows[0], work) == ['foto_1.jpg']
+        assert (work / 'foto_1.jpg').read_bytes() == Path(rows[0]['photo_assets'][0]['print']).read_bytes()
+    finally:
+        server.close()
+
+
+def test_local_paths_are_rejected(tmp_path: Path) -> None:
+    secret = tmp_path / 'secret.jpg'
+    secret.write_bytes(_jpeg((0, 0, 0), (64, 64)))
+    root = tmp_path / 'cache'
+    cache = PhotoCache(root)
+    # even a stale index entry must not serve a local path
+    cache._urls[str(secret)] = 'f' * 64
+    for url in (str(secret), secret.as_uri(), '/etc/passwd', 'ftp://example.com/a.jpg'):
+        assert cache.fetch(url) is None
+    rows = [{'photos': [str(secret)]}]
+    attach_photos(rows, cache)
+    assert rows[0]['photo_assets'] == []
+    assert not [p for p in root.rglob('*') if p.is_file() and p.name != 'urls.json']
@@ -0,0 +1,134 @@
+"""Eviction policies of ``storage.StorageManager.sweep``.
+
+    python -m pytest -q test_storage.py
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+
+from storage import StorageManager
+
+DAY = 24 * 3600
+
+
+def _work_dir(root: Path, order: str, rid: str, status: str | None, age_days: float = 0,
+              size: int = 1000) -> Path:
+    """A bundled work dir whose files are all ``age_days`` old."""
+    path = root / f'order_{order}_{rid}'
+    files = {'docs/libro.pdf': size, 'qr/qr.png': 10, 'audio/voice.mp3': 10}
+    for rel, n in files.items():
+        (path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (path / rel).write_bytes(b'x' * n)
+    manifest = {'order': order, 'id': rid}
+    if status is not None:
+        manifest['status'] = status
+    (path / 'manifest.json').write_text(json.dumps(manifest), encoding='utf-8')
+    _age(path, age_days)
+    return path
+
+
+def _zip(root: Path, order: str, age_days: float = 0) -> Path:
+    path = root / f'order_{order}.zip'
+    path.write_bytes(b'z' * 100)
+    _age(path, age_days)
+    return path
+
+
+def _age(path: Path, days: float) -> None:
+    stamp = time.time() - days * DAY
+    for p in [path, *path.rglob('*')] if path.is_dir() else [path]:
+        os.utime(p, (stamp, stamp))
+
+
+def _manager(tmp_path: Path, **kwargs) -> tuple[StorageManager, Path, list[str]]:
+    root = tmp_path / 'downloads'
+    root.mkdir()
+    evicted: list[str] = []
+    manager = StorageManager(root, tmp_path / 'tmp', on_evict=lambda p: evicted.append(p.name), **kwargs)
+    return manager, root, evicted
+
+
+def test_done_order_keeps_zip_audio_and_manifest(tmp_path: Path) -> None:
+    manager, root, evicted = _manager(tmp_path)
+    done = _work_dir(root, '1', 'a', 'DONE')
+    zip_path = _zip(root, '1')
+    unzipped = _work_dir(root, '2', 'b', 'DONE')
+
+    summary = manager.sweep()
+
+    assert sorted(p.name for p in done.iterdir()) == ['audio', 'manifest.json']
+    assert (done / 'audio' / 'voice.mp3').exists()
+    assert zip_path.exists()
+    # without its ZIP a DONE order has nothing to fall back on and is left whole
+    assert (unzipped / 'docs' / 'libro.pdf').exists()
+    assert summary['purged_bytes'] >= 1000
+    assert evicted == []
+
+
+def test_unknown_or_active_status_is_never_evicted(tmp_path: Path) -> None:
+    manager, root, evicted = _manager(
+        tmp_path, quota_bytes=0, max_age=DAY,
+        statuses=lambda: {'mem': 'Pending storybook upload'})
+    kept = [
+        _work_dir(root, '1', 'nomanifest', None, age_days=30),
+        _work_dir(root, '2', 'nostatus', None, age_days=30),
+        _work_dir(root, '3', 'active', 'Pending to Storybook', age_days=30),
+        # the in-memory status wins over a stale manifest
+        _work_dir(root, '4', 'mem', 'DONE', age_days=30),
+    ]
+    (kept[0] / 'manifest.json').unlink()
+    (kept[1] / 'manifest.json').write_text('{}', encoding='utf-8')
+    finished = _work_dir(root, '5', 'old', 'DONE', age_days=30)
+
+    manager.sweep()
+
+    assert all((p / 'docs' / 'libro.pdf').exists() for p in kept)
+    assert not finished.exists()
+    assert evicted == [finished.name]
+
+
+def test_quota_evicts_oldest_finished_orders_first(tmp_path: Path) -> None:
+    manager, root, evicted = _manager(tmp_path)
+    oldest = _work_dir(root, '1', 'a', 'DONE', age_days=3)
+    middle = _work_dir(root, '2', 'b', 'DONE', age_days=2)
+    newest = _work_dir(root, '3', 'c', 'DONE', age_days=1)
+    active = _work_dir(root, '4', 'd', 'Pending to NotebookLM', age_days=10)
+    used = sum(e['total_bytes'] for e in manager.usage())
+    per_order = used // 4
+    manager.quota_bytes = used - per_order // 2
+
+    manager.sweep()
+
+    assert evicted == [oldest.name]
+    assert not oldest.exists()
+    assert middle.exists() and newest.exists() and active.exists()
+
+    manager.quota_bytes = per_order * 2 + per_order // 2
+    manager.sweep()
+    assert evicted == [oldest.name, middle.name]
+    assert newest.exists() and active.exists()
+
+
+def test_zip_is_removed_with_the_last_work_dir_of_its_order(tmp_path: Path) -> None:
+    manager, root, evicted = _manager(tmp_path, max_age=DAY)
+    first = _work_dir(root, '7', 'a', 'DONE', age_days=5)
+    second = _work_dir(root, '7', 'b', 'Pending to Storybook', age_days=5)
+    # an order number that only shares a prefix is not a sibling
+    other = _work_dir(root, '70', 'c', 'Pending to Storybook', age_days=5)
+    zip_path = _zip(root, '7', age_days=5)
+
+    manager.sweep()
+    assert not first.exists()
+    assert second.exists() and other.exists()
+    assert zip_path.exists()
+
+    (second / 'manifest.json').write_text(json.dumps({'status': 'DONE'}), encoding='utf-8')
+    _age(second, 5)
+    manager.sweep()
+    assert not second.exists()
+    assert not zip_path.exists()
+    assert other.exists()
+    assert evicted == [first.name, second.name]
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Any, Iterable, Optional, Union
+
+import pandas as pd
+
+# Shopify packs the product options of an order into its tags, e.g.
+#   "Escoja su letra: V, Tamaño: Medio (10 Centímetros), Temática: Corazones + 3.99€,
+#    tepo, Tonalidad: Rosado, ¿Como la prefieres?: Lista para decorar"
+# Each rule maps option labels (compared without accents, case or punctuation)
+# to a field; ``multi`` fields collect every occurrence into a list.
+RULES: tuple[dict[str, Any], ...] = (
+    {'field': 'letters', 'labels': ('escoja su letra', 'letra', 'inicial'), 'multi': True},
+    {'field': 'size', 'labels': ('tamano', 'talla', 'medida'), 'multi': False},
+    {'field': 'theme', 'labels': ('tematica', 'tema'), 'multi': False},
+    {'field': 'tones', 'labels': ('tonalidad', 'color', 'colores'), 'multi': True},
+    {'field': 'finish', 'labels': ('como la prefieres', 'acabado'), 'multi': False},
+)
+# Option values that mean "nothing chosen".
+NONE_VALUES = {'sin tematica', 'ninguno', 'ninguna', 'no', 'nan', ''}
+
+# Commas separate options. A decimal comma inside a price ("+ 3,99€") or a
+# size ("(10,5 cm)") is turned into a point first; ``re`` lookbehinds are
+# fixed-width and cannot match "+ <digits>".
+DECIMAL_COMMA_RE = re.compile(r'(\+\s*\d+|\(\d+),(?=\d)')
+SPLIT_RE = re.compile(r'\s*,\s*')
+OPTION_RE = re.compile(
+    r'^\s*(?:(?P<label>[^:]+?)\s*:\s*)?(?P<value>.*?)'
+    r'(?:\s*\+\s*(?P<price>\d+(?:[.,]\d+)?)\s*€?)?\s*$'
+)
+SIZE_CM_RE = re.compile(r'\s*\((?P<cm>\d+(?:[.,]\d+)?)\s*(?:cm|cent[ií]metros?)\)', re.I)
+_LABEL_FIELDS = {label: rule for rule in RULES for label in rule['labels']}
+
+# What ``_compile_option`` returns: ``('tag', value)``, ``('option', label,
+# value, extra)`` or ``('multi' | 'field', field, chosen, extra, size_cm)``.
+Action = Union[
+    tuple[str, str],
+    tuple[str, str, str, Optional[dict[str, Any]]],
+    tuple[str, str, Optional[str], Optional[dict[str, Any]], Optional[float]],
+]
+
+
+def normalize_label(label: str) -> str:
+    text = unicodedata.normalize('NFKD', label).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9 ]', '', text.lower()).strip()
+
+
+def split_options(text: str) -> list[str]:
+    """Split one tag string into its options."""
+    return SPLIT_RE.split(DECIMAL_COMMA_RE.sub(r'\1.', text))
+
+
+def _empty() -> dict[str, Any]:
+    return {'letters': [], 'size': None, 'size_cm': None, 'theme': None, 'tones': [],
+            'finish': None, 'options': {}, 'extras': [], 'extras_total': 0.0}
+
+
+def _compile_option(part: str) -> Action:
+    """Turn one distinct option string into the action that applies it."""
+    m = OPTION_RE.match(part)
+    label, value, price = m['label'], m['value'], m['price']
+    if label is None:
+        return ('tag', value)
+    extra = None
+    if price:
+        extra = {'option': label, 'value': value, 'price': float(price.replace(',', '.'))}
+    rule = _LABEL_FIELDS.get(normalize_label(label))
+    if rule is None:
+        return ('option', label, value, extra)
+    cm = None
+    if rule['field'] == 'size' and (size := SIZE_CM_RE.search(value)):
+        cm = float(size['cm'].replace(',', '.'))
+        value = SIZE_CM_RE.sub('', value).strip()
+    chosen = None if normalize_label(value) in NONE_VALUES else value
+    return ('multi' if rule['multi'] else 'field', rule['field'], chosen, extra, cm)
+
+
+def _parse_unique(strings: pd.Series) -> list[tuple[list[str], dict[str, Any]]]:
+    """Parse distinct tag strings.
+
+    The column is split into options with one vectorised pandas operation;
+    exports repeat a few hundred distinct options across all orders, so each
+    distinct option is compiled once and then only applied per order.
+    """
+    parts = strings.str.strip().str.replace(DECIMAL_COMMA_RE, r'\1.', regex=True)
+    parts = parts.str.split(SPLIT_RE).explode()
+    parts = parts[parts.fillna('').ne('')]
+    codes, distinct = pd.factorize(parts)
+    actions = [_compile_option(p) for p in distinct]
+
+    results = [([], _empty()) for _ in range(len(strings))]
+    for i, code in zip(parts.index, codes):
+        tags, spec = results[i]
+        action = actions[code]
+        kind = action[0]
+        if kind == 'tag':
+            tags.append(action[1])
+            continue
+        if kind == 'option':
+            spec['options'][action[1]] = action[2]
+        elif kind == 'multi':
+            if action[2] and action[2] not in spec[action[1]]:
+                spec[action[1]].append(action[2])
+        else:
+            spec[action[1]] = action[2]
+            if action[4] is not None:
+                spec['size_cm'] = action[4]
+        if action[3] is not None:
+            spec['extras'].append(action[3])
+            spec['extras_total'] = round(spec['extras_total'] + action[3]['price'], 2)
+    return results
+
+
+def parse_variants(values: Iterable[Any]) -> list[tuple[list[str], dict[str, Any]]]:
+    """Split raw Shopify tag strings into ``(plain tags, variant)`` per order.
+
+    Plain tags are the entries without a ``label:`` (e.g. ``tepo``, ``voice``)
+    and keep working with ``'voice' in row['tags']``. The variant holds the
+    structured options: ``letters``, ``size``/``size_cm``, ``theme``,
+    ``tones``, ``finish``, unknown labelled ``options`` and priced
+    ``extras`` with their ``extras_total``.
+
+    Every distinct string is parsed once and orders with the same string
+    share the same (read-only) result objects.
+    """
+    codes, uniques = pd.factorize(pd.Series(list(values), dtype=object))
+    if not len(codes):
+        return []
+    text = pd.Series(uniques, dtype=object).astype(str)
+    parsed = _parse_unique(text.mask(text.str.strip().str.lower() == 'nan', ''))
+    parsed.append(([], _empty()))  # code -1: missing cell
+    return [parsed[c] for c in codes]
+
+
+def parse_variant(value: Any) -> tuple[list[str], dict[str, Any]]:
+    return parse_variants([value])[0]
+
+
+def variant_text(variant: dict[str, Any] | None) -> str:
+    """Flat text of a variant for the search index and CSV export."""
+    if not variant:
+        return ''
+    parts = [*variant.get('letters', []), variant.get('size') or '', variant.get('theme') or '',
+             *variant.get('tones', []), variant.get('finish') or '', *variant.get('options', {}).values()]
+    return ' '.join(p for p in parts if p)